@@ -0,0 +1,864 @@
+#!/usr/bin/env python
+import argparse
+import contextlib
+import datetime
+import http.server
+import io
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import typing
+import urllib.parse
+import zlib
+
+import ImportJson
+import Library
+import RenameFolders
+import Scrub
+from Library import DeleteReason, DownloadReason, RecordingCategory
+
+SCHEMA = """
+CREATE TABLE "__EFMigrationsHistory" (
+    "MigrationId" TEXT NOT NULL CONSTRAINT "PK___EFMigrationsHistory" PRIMARY KEY,
+    "ProductVersion" TEXT NOT NULL
+);
+CREATE TABLE "Series" (
+    "Id" INTEGER NOT NULL CONSTRAINT "PK_Series" PRIMARY KEY AUTOINCREMENT,
+    "Metadata_SeriesId" TEXT NULL,
+    "Metadata_Title" TEXT NULL,
+    "Metadata_Category" INTEGER NULL,
+    "Metadata_ImageUrl" TEXT NULL,
+    "Metadata_PosterUrl" TEXT NULL,
+    "Metadata_StartTime" TEXT NULL,
+    "Metadata_IsNew" INTEGER NULL,
+    "Metadata_Url" TEXT NULL
+);
+CREATE TABLE "Episodes" (
+    "Id" INTEGER NOT NULL CONSTRAINT "PK_Episodes" PRIMARY KEY AUTOINCREMENT,
+    "SeriesId" INTEGER NULL,
+    "SeriesStartTime" TEXT NOT NULL,
+    "Metadata_Category" INTEGER NULL,
+    "Metadata_ChannelImageUrl" TEXT NULL,
+    "Metadata_ChannelName" TEXT NULL,
+    "Metadata_ChannelNumber" TEXT NULL,
+    "Metadata_EndTime" TEXT NULL,
+    "Metadata_EpisodeNumber" TEXT NULL,
+    "Metadata_EpisodeTitle" TEXT NULL,
+    "Metadata_FirstAiring" INTEGER NULL,
+    "Metadata_ImageUrl" TEXT NULL,
+    "Metadata_MovieScore" TEXT NULL,
+    "Metadata_OriginalAirdate" TEXT NULL,
+    "Metadata_PosterUrl" TEXT NULL,
+    "Metadata_ProgramId" TEXT NULL,
+    "Metadata_RecordEndTime" TEXT NULL,
+    "Metadata_RecordError" TEXT NULL,
+    "Metadata_RecordStartTime" TEXT NULL,
+    "Metadata_RecordSuccess" INTEGER NULL,
+    "Metadata_SeriesId" TEXT NULL,
+    "Metadata_StartTime" TEXT NULL,
+    "Metadata_Synopsis" TEXT NULL,
+    "Metadata_Title" TEXT NULL,
+    "Metadata_Filename" TEXT NULL,
+    "Metadata_PlayUrl" TEXT NULL,
+    "Metadata_CmdUrl" TEXT NULL,
+    "DownloadInterrupted" INTEGER NOT NULL,
+    "DownloadStarted" TEXT NOT NULL,
+    "DownloadReason" INTEGER NOT NULL,
+    "DeleteReason" INTEGER NOT NULL,
+    "ReRecordable" INTEGER NOT NULL,
+    CONSTRAINT "FK_Episodes_Series_SeriesId" FOREIGN KEY ("SeriesId")
+        REFERENCES "Series" ("Id")
+);
+CREATE INDEX "IX_Episodes_SeriesId" ON "Episodes" ("SeriesId");
+INSERT INTO "__EFMigrationsHistory" ("MigrationId", "ProductVersion")
+VALUES ('20250924032751_InitialCreate', '8.0.11');
+"""
+TS_PACKET = b"\x47" + bytes(187)
+EPOCH = 1735732800
+EPISODE_SECONDS = 1800
+SERIES_DIRNAME_RE = re.compile("^(.+) [(]([^)]+)[)]$")
+EPISODE_FILENAME_RE = re.compile(
+    "^.+ (S([0-9]+)E[0-9]+) (?:[0-9]+ )?(\\[[^\\]]+\\])([.][^.]+)$"
+)
+MOVIE_FILENAME_RE = re.compile("^.+ [0-9]+ (\\[[^\\]]+\\])([.][^.]+)$")
+FILENAME_RE = re.compile(
+    "^.*"
+    "[/\\\\]"
+    "([^/\\\\]+) \\[([^/\\\\\\]]+)\\]"
+    "[/\\\\]"
+    "(?:Season ([0-9]+))?"
+    "[/\\\\]?"
+    "([^/\\\\]+) - \\[([^/\\\\\\]]+)\\]([.][^./\\\\]+)$"
+)
+SERIES_EPISODE_RE = re.compile("^(.+) S([0-9]+)E([0-9]+)")
+PARSER_EDGE_CASES = (
+    ("Show (C1)", "Show S01E02 20250101 [20250101-1200 4.1].mpg"),
+    ("Show (C1)", "Show S01E02 [20250101-1200 4.1].mpg"),
+    ("Show (C1)", "Show 20250101 [20250101-1200 4.1].mpg"),
+    ("Show (US) (C1)", "Show (US) S12E345 20250101 [a[b].ts"),
+    ("Show [2] (C1)", "Show [2] S01E02 7 [x].mpg"),
+    ("Show (C1)", "Show S01E02 [x].mpg.episode.json"),
+    ("Show (C1)", "Show S1E [x].mpg"),
+    ("Show (C1)", "Show S01E02 [].mpg"),
+    ("Show (C1)", "S01E02 [x].mpg"),
+    ("Show ()", "Show S01E02 [x].mpg"),
+    ("Show", "Show S01E02 [x].mpg"),
+)
+PATH_EDGE_CASES = (
+    "/lib/Show [C1]/Season 01/Show S01E02 - [20250101-1200 4.1].mpg",
+    "/lib/Show [C1]/Show - [20250101-1200 4.1].mpg",
+    "/lib/Show [C1]/Season 1/Show S1E2 extra - [t].mpg",
+    "/lib/Show - Part [2] (US) [C1]/Season 03/Show - Part [2] (US) S03E04 - [t].ts",
+    "/lib/Show [ []/Show - [ - []/x - [t].mpg",
+    "/lib/Show [C1]/Specials/Show - [t].mpg",
+    "/lib/Show [C1]/Season 01/Show S01E02 - [t]",
+    "/lib/Show [C1]/Season 01/Show S01E02 - [t].",
+    "/lib/Show [C1]/Season 01/Show S01E02 [t].mpg",
+    "C:\\lib\\Show [C1]\\Season 01\\Show S01E02 - [t].mpg",
+    "Show [C1]/Show - [t].mpg",
+    "/Show [C1]/Show - [t].mpg",
+)
+
+
+class Recording(typing.NamedTuple):
+    series_title: str
+    series_id: str
+    season_num: int
+    episode_num: int
+    program_id: str
+    start_time: int
+    tag: str
+    storage: dict[str, typing.Any]
+    episode: dict[str, typing.Any]
+
+
+def create_database(dir: str) -> None:
+    with contextlib.closing(Library.connect(dir)) as conn:
+        conn.executescript(SCHEMA)
+
+
+def missing(program_id: str, fraction: float) -> bool:
+    return zlib.crc32(program_id.encode()) % 10000 < fraction * 10000
+
+
+def series_recordings(
+    base_url: str, s: int, episodes: int
+) -> typing.Iterator[Recording]:
+    series_title = f"Series {s:05d}"
+    series_id = f"C{s:08d}EN"
+    series_start = EPOCH + s * 86400
+    storage = {
+        "SeriesID": series_id,
+        "Title": series_title,
+        "Category": "series",
+        "ImageURL": f"https://img.hdhomerun.com/titles/{series_id}.jpg",
+        "StartTime": series_start,
+        "New": 1,
+        "EpisodesURL": f"{base_url}/recorded_files.json?SeriesID={series_id}",
+    }
+    for e in range(episodes):
+        season_num = e // 20 + 1
+        episode_num = e % 20 + 1
+        program_id = f"EP{s:08d}{e:04d}"
+        start_time = series_start + e * 604800
+        start = datetime.datetime.fromtimestamp(start_time, datetime.timezone.utc)
+        tag = f"[{start:%Y%m%d-%H%M} {s % 100:02d}.1]"
+        filename = (
+            f"{series_title} S{season_num:02d}E{episode_num:02d} {start:%Y%m%d}"
+            f" {tag}.mpg"
+        )
+        yield Recording(
+            series_title=series_title,
+            series_id=series_id,
+            season_num=season_num,
+            episode_num=episode_num,
+            program_id=program_id,
+            start_time=start_time,
+            tag=tag,
+            storage=storage,
+            episode={
+                "Category": "series",
+                "ChannelName": f"CH{s % 100:02d}",
+                "ChannelNumber": f"{s % 100:02d}.1",
+                "EndTime": start_time + EPISODE_SECONDS,
+                "EpisodeNumber": f"S{season_num:02d}E{episode_num:02d}",
+                "EpisodeTitle": f"Episode {e:04d}",
+                "FirstAiring": 1,
+                "ImageURL": f"https://img.hdhomerun.com/titles/{series_id}.jpg",
+                "OriginalAirdate": start_time,
+                "ProgramID": program_id,
+                "RecordEndTime": start_time + EPISODE_SECONDS + 30,
+                "RecordStartTime": start_time - 30,
+                "RecordSuccess": 1,
+                "SeriesID": series_id,
+                "StartTime": start_time,
+                "Synopsis": f"Synopsis of episode {e} of series {s}.",
+                "Title": series_title,
+                "Filename": filename,
+                "PlayURL": f"{base_url}/recorded/play?id={program_id}",
+                "CmdURL": f"{base_url}/recorded/cmd?id={program_id}",
+            },
+        )
+
+
+def recordings(base_url: str, series: int, episodes: int) -> typing.Iterator[Recording]:
+    for s in range(series):
+        yield from series_recordings(base_url, s, episodes)
+
+
+def to_episode(recording: Recording, deleted: bool) -> ImportJson.Episode:
+    storage = recording.storage
+    episode = recording.episode
+    return ImportJson.Episode(
+        Series=ImportJson.Series(
+            Metadata_SeriesId=storage["SeriesID"],
+            Metadata_Title=storage["Title"],
+            Metadata_Category=RecordingCategory.Series,
+            Metadata_ImageUrl=storage["ImageURL"],
+            Metadata_PosterUrl=None,
+            Metadata_StartTime=ImportJson.gettime(storage["StartTime"]),
+            Metadata_IsNew=bool(storage["New"]),
+            Metadata_Url=storage["EpisodesURL"],
+        ),
+        SeriesStartTime=ImportJson.gettime(storage["StartTime"]),
+        Metadata_Category=RecordingCategory.Series,
+        Metadata_ChannelImageUrl=None,
+        Metadata_ChannelName=episode["ChannelName"],
+        Metadata_ChannelNumber=episode["ChannelNumber"],
+        Metadata_EndTime=ImportJson.gettime(episode["EndTime"]),
+        Metadata_EpisodeNumber=episode["EpisodeNumber"],
+        Metadata_EpisodeTitle=episode["EpisodeTitle"],
+        Metadata_FirstAiring=bool(episode["FirstAiring"]),
+        Metadata_ImageUrl=episode["ImageURL"],
+        Metadata_MovieScore=None,
+        Metadata_OriginalAirdate=ImportJson.gettime(episode["OriginalAirdate"]),
+        Metadata_PosterUrl=None,
+        Metadata_ProgramId=episode["ProgramID"],
+        Metadata_RecordEndTime=ImportJson.gettime(episode["RecordEndTime"]),
+        Metadata_RecordError=None,
+        Metadata_RecordStartTime=ImportJson.gettime(episode["RecordStartTime"]),
+        Metadata_RecordSuccess=bool(episode["RecordSuccess"]),
+        Metadata_SeriesId=episode["SeriesID"],
+        Metadata_StartTime=ImportJson.gettime(episode["StartTime"]),
+        Metadata_Synopsis=episode["Synopsis"],
+        Metadata_Title=episode["Title"],
+        Metadata_Filename=episode["Filename"],
+        Metadata_PlayUrl=episode["PlayURL"],
+        Metadata_CmdUrl=episode["CmdURL"],
+        DownloadInterrupted=False,
+        DownloadStarted=ImportJson.gettime(episode["RecordStartTime"]),
+        DownloadReason=DownloadReason.New,
+        DeleteReason=DeleteReason.Downloaded if deleted else DeleteReason.NotDeleted,
+        ReRecordable=False,
+    )
+
+
+def generate(
+    dir: str,
+    series: int,
+    episodes: int,
+    layout: str = "old",
+    base_url: str = "http://127.0.0.1:5004",
+    packets: int = 16,
+    missing_fraction: float = 0.1,
+) -> int:
+    os.makedirs(dir, exist_ok=True)
+    create_database(dir)
+    media = TS_PACKET * packets
+    series_ids: dict[str, int] = {}
+    series_rows: list[tuple[typing.Any, ...]] = []
+    episode_rows: list[tuple[typing.Any, ...]] = []
+    count = 0
+    for recording in recordings(base_url, series, episodes):
+        filename = recording.episode["Filename"]
+        if layout == "old":
+            video_dir = os.path.join(
+                dir, f"{recording.series_title} ({recording.series_id})"
+            )
+            video_name = filename
+        else:
+            video_dir = os.path.join(
+                dir,
+                f"{recording.series_title} [{recording.series_id}]",
+                f"Season {recording.season_num:02d}",
+            )
+            video_name = (
+                f"{recording.series_title}"
+                f" S{recording.season_num:02d}E{recording.episode_num:02d}"
+                f" - {recording.tag}.mpg"
+            )
+        os.makedirs(video_dir, exist_ok=True)
+        video_path = os.path.join(video_dir, video_name)
+        with open(video_path, "wb") as f:
+            f.write(media)
+        os.utime(video_path, (recording.start_time, recording.start_time))
+        if layout == "old":
+            with open(f"{video_path}.storage.json", "w") as f:
+                json.dump(recording.storage, f)
+            with open(f"{video_path}.episode.json", "w") as f:
+                json.dump(recording.episode, f)
+        else:
+            episode = to_episode(
+                recording, missing(recording.program_id, missing_fraction)
+            )
+            series_id = series_ids.get(recording.series_id)
+            if series_id is None:
+                series_id = len(series_ids) + 1
+                series_ids[recording.series_id] = series_id
+                series_rows.append(ImportJson.series_values(series_id, episode.Series))
+            episode_rows.append(ImportJson.episode_values(series_id, episode))
+        count += 1
+    with contextlib.closing(Library.connect(dir)) as conn, conn:
+        conn.executemany(
+            ImportJson.insert_sql("Series", ImportJson.SERIES_COLUMNS), series_rows
+        )
+        conn.executemany(
+            ImportJson.insert_sql("Episodes", ImportJson.EPISODE_COLUMNS),
+            episode_rows,
+        )
+    return count
+
+
+class TunerHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "Tuner"
+
+    def log_message(self, format: str, *args: typing.Any) -> None:
+        pass
+
+    def respond(self, body: bool) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        if self.server.latency > 0:
+            time.sleep(self.server.latency)
+        self.server.count(self.command)
+        content_type = "video/mpeg"
+        data = b""
+        if random.random() < self.server.busy:
+            status = 503
+        elif url.path == "/recorded_files.json" and "SeriesID" in query:
+            status, content_type, data = self.episodes(query["SeriesID"][0])
+        elif url.path != "/recorded/play" or "id" not in query:
+            status = 404
+        elif missing(query["id"][0], self.server.missing):
+            status = 404
+        else:
+            status = 200
+            data = TS_PACKET * 4
+        if status == 200 and "Range" in self.headers:
+            self.send_response(206)
+            data = data[:1]
+        else:
+            self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if body:
+            self.wfile.write(data)
+
+    def episodes(self, series_id: str) -> tuple[int, str, bytes]:
+        if not (series_id.startswith("C") and series_id[1:-2].isdigit()):
+            return 404, "application/json", b""
+        return (
+            200,
+            "application/json",
+            json.dumps(
+                [
+                    recording.episode
+                    for recording in series_recordings(
+                        self.server.base_url,
+                        int(series_id[1:-2]),
+                        self.server.episodes,
+                    )
+                    if not missing(recording.program_id, self.server.missing)
+                ]
+            ).encode(),
+        )
+
+    def do_HEAD(self) -> None:
+        self.respond(False)
+
+    def do_GET(self) -> None:
+        self.respond(True)
+
+
+class Tuner(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        missing: float = 0.1,
+        busy: float = 0.0,
+        latency: float = 0.0,
+        episodes: int = 10,
+    ) -> None:
+        super().__init__(address, TunerHandler)
+        self.missing = missing
+        self.busy = busy
+        self.latency = latency
+        self.episodes = episodes
+        self.requests: dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        if isinstance(host, bytes):
+            host = host.decode()
+        return f"http://{host}:{port}"
+
+    def count(self, method: str) -> None:
+        with self.lock:
+            self.requests[method] = self.requests.get(method, 0) + 1
+
+
+@contextlib.contextmanager
+def serve(
+    missing: float = 0.1, busy: float = 0.0, latency: float = 0.0
+) -> typing.Iterator[Tuner]:
+    tuner = Tuner(("127.0.0.1", 0), missing, busy, latency)
+    thread = threading.Thread(target=tuner.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield tuner
+    finally:
+        tuner.shutdown()
+        tuner.server_close()
+        thread.join()
+
+
+def timed(fn: typing.Callable[[], typing.Any]) -> float:
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()
+    return time.perf_counter() - start
+
+
+def run(
+    sizes: list[tuple[int, int]],
+    missing: float = 0.1,
+    busy: float = 0.0,
+    latency: float = 0.0,
+    jobs: int = 8,
+    max_per_host: int = 2,
+    packets: int = 16,
+    keep: str | None = None,
+    probe_each: bool = False,
+    bulk_load: str | None = None,
+) -> None:
+    print(
+        f"{'size':>12} {'stage':<16} {'files':>8} {'seconds':>10} {'files/s':>10}"
+        f" {'requests':>9}"
+    )
+    with serve(missing, busy, latency) as tuner:
+        for series, episodes in sizes:
+            tuner.episodes = episodes
+            with tempfile.TemporaryDirectory(dir=keep) as dir:
+                files = generate(
+                    dir, series, episodes, "old", tuner.base_url, packets, missing
+                )
+                for stage, fn in (
+                    (
+                        "import_json",
+                        lambda: ImportJson.import_json(
+                            dir,
+                            jobs=jobs,
+                            max_per_host=max_per_host,
+                            probe_each=probe_each,
+                            bulk_load=bulk_load,
+                        ),
+                    ),
+                    ("rename_folders", lambda: RenameFolders.rename_folders(dir)),
+                    ("scrub", lambda: Scrub.scrub(dir)),
+                ):
+                    tuner.requests.clear()
+                    seconds = timed(fn)
+                    print(
+                        f"{f'{series}x{episodes}':>12} {stage:<16} {files:>8}"
+                        f" {seconds:>10.3f} {files / seconds:>10.1f}"
+                        f" {sum(tuner.requests.values()):>9}"
+                    )
+
+
+def regex_parse_recording(
+    series_dirname: str, video_filename: str
+) -> Library.Recording | None:
+    series_match = SERIES_DIRNAME_RE.match(series_dirname)
+    if series_match is None:
+        return None
+    episode_match = EPISODE_FILENAME_RE.match(video_filename)
+    if episode_match is not None:
+        return Library.Recording(
+            series_name=series_match.group(1),
+            series_id=series_match.group(2),
+            series_num=int(episode_match.group(2)),
+            episode_num_encoded=episode_match.group(1),
+            tag=episode_match.group(3),
+            file_ext=episode_match.group(4),
+        )
+    movie_match = MOVIE_FILENAME_RE.match(video_filename)
+    if movie_match is not None:
+        return Library.Recording(
+            series_name=series_match.group(1),
+            series_id=series_match.group(2),
+            series_num=None,
+            episode_num_encoded=None,
+            tag=movie_match.group(1),
+            file_ext=movie_match.group(2),
+        )
+    return None
+
+
+def regex_parse_path(video_path: str) -> Library.LibraryPath | None:
+    match = FILENAME_RE.match(video_path)
+    if match is None:
+        return None
+    file_title = match.group(4)
+    series_episode_match = SERIES_EPISODE_RE.match(file_title)
+    if series_episode_match is not None:
+        file_title = series_episode_match.group(1)
+        file_season_num = series_episode_match.group(2)
+        episode_num = series_episode_match.group(3)
+    else:
+        file_season_num = None
+        episode_num = None
+    return Library.LibraryPath(
+        series_title=match.group(1),
+        series_id=match.group(2),
+        season_num=match.group(3),
+        file_title=file_title,
+        file_season_num=file_season_num,
+        episode_num=episode_num,
+        tag=match.group(5),
+        file_ext=match.group(6),
+    )
+
+
+def parser_corpus(
+    count: int, depth: int, title_length: int
+) -> tuple[list[tuple[str, str]], list[str]]:
+    root = "/" + "/".join(f"volume{i:02d}" for i in range(depth))
+    names: list[tuple[str, str]] = []
+    paths: list[str] = []
+    for i, recording in enumerate(
+        recordings("http://127.0.0.1", max(1, count // 20), 20)
+    ):
+        title = f"{recording.series_title} - Part [{i % 7}] (US)"
+        title = (title + " The Long Running Show") * (
+            title_length // (len(title) + 22) + 1
+        )
+        title = title[:title_length].rstrip(" -[(")
+        date = datetime.datetime.fromtimestamp(
+            recording.start_time, datetime.timezone.utc
+        )
+        if i % 10 == 0:
+            filename = f"{title} {date:%Y%m%d} {recording.tag}.mpg"
+        else:
+            filename = (
+                f"{title} S{recording.season_num:02d}E{recording.episode_num:02d}"
+                f" {date:%Y%m%d} {recording.tag}.mpg"
+            )
+        names.append((f"{title} ({recording.series_id})", filename))
+        parsed = Library.parse_recording(*names[-1])
+        if parsed is not None:
+            paths.append(
+                os.path.join(
+                    root, Library.target_dir(parsed), Library.target_name(parsed)
+                )
+            )
+    return names, paths
+
+
+def expected_path(recording: Library.Recording) -> Library.LibraryPath:
+    file_season_num = None
+    episode_num = None
+    if recording.episode_num_encoded is not None:
+        file_season_num, _, episode_num = recording.episode_num_encoded[1:].partition(
+            "E"
+        )
+    return Library.LibraryPath(
+        series_title=recording.series_name,
+        series_id=recording.series_id,
+        season_num=(
+            f"{recording.series_num:02d}" if recording.series_num is not None else None
+        ),
+        file_title=recording.series_name,
+        file_season_num=file_season_num,
+        episode_num=episode_num,
+        tag=recording.tag[1:-1],
+        file_ext=recording.file_ext,
+    )
+
+
+def best(fn: typing.Callable[[], typing.Any], repeat: int) -> float:
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def parser_benchmark(
+    count: int = 10000, depth: int = 8, title_length: int = 60, repeat: int = 5
+) -> bool:
+    names, paths = parser_corpus(count, depth, title_length)
+    failures: list[str] = []
+    for series_dirname, video_filename in (*names, *PARSER_EDGE_CASES):
+        expected = regex_parse_recording(series_dirname, video_filename)
+        actual = Library.parse_recording(series_dirname, video_filename)
+        if actual != expected:
+            failures.append(
+                f"parse_recording({series_dirname!r}, {video_filename!r}):"
+                f" {actual} != {expected}"
+            )
+    for video_path in (*paths, *PATH_EDGE_CASES):
+        expected_match = regex_parse_path(video_path)
+        actual_match = Library.parse_path(video_path)
+        if actual_match != expected_match:
+            failures.append(
+                f"parse_path({video_path!r}): {actual_match} != {expected_match}"
+            )
+    for series_dirname, video_filename in names:
+        recording = Library.parse_recording(series_dirname, video_filename)
+        if recording is None:
+            failures.append(f"unparsed {series_dirname!r}, {video_filename!r}")
+            continue
+        relpath = os.path.join(
+            Library.target_dir(recording), Library.target_name(recording)
+        )
+        if Library.parse_relpath(relpath) != expected_path(recording):
+            failures.append(f"round trip {relpath!r}: {Library.parse_relpath(relpath)}")
+    print(f"{'parser':<24} {'items':>8} {'seconds':>10} {'ns/item':>10}")
+    for name, fn, items in (
+        (
+            "regex_parse_recording",
+            lambda: [regex_parse_recording(d, f) for d, f in names],
+            len(names),
+        ),
+        (
+            "parse_recording",
+            lambda: [Library.parse_recording(d, f) for d, f in names],
+            len(names),
+        ),
+        ("regex_parse_path", lambda: [regex_parse_path(p) for p in paths], len(paths)),
+        ("parse_path", lambda: [Library.parse_path(p) for p in paths], len(paths)),
+    ):
+        seconds = best(fn, repeat)
+        print(f"{name:<24} {items:>8} {seconds:>10.4f} {seconds / items * 1e9:>10.0f}")
+    for failure in failures:
+        print(failure)
+    return len(failures) == 0
+
+
+def size(value: str) -> tuple[int, int]:
+    series, _, episodes = value.partition("x")
+    return int(series), int(episodes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the migration scripts against a synthetic library"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    generate_parser = subparsers.add_parser(
+        "generate", help="generate a synthetic library"
+    )
+    generate_parser.add_argument("dir", help="root directory of library")
+    generate_parser.add_argument(
+        "-s", type=int, default=10, help="number of series", dest="series"
+    )
+    generate_parser.add_argument(
+        "-e",
+        type=int,
+        default=10,
+        help="number of episodes per series",
+        dest="episodes",
+    )
+    generate_parser.add_argument(
+        "--layout",
+        choices=("old", "new"),
+        default="old",
+        help="generate JSON sidecars in the old layout, or database rows in the new",
+        dest="layout",
+    )
+    generate_parser.add_argument(
+        "--base-url",
+        default="http://127.0.0.1:5004",
+        help="base URL of the tuner to put in the PlayURLs",
+        dest="base_url",
+    )
+    generate_parser.add_argument(
+        "--packets",
+        type=int,
+        default=16,
+        help="number of MPEG-TS packets in each video file",
+        dest="packets",
+    )
+    generate_parser.add_argument(
+        "--missing",
+        type=float,
+        default=0.1,
+        help="fraction of recordings deleted from the tuner",
+        dest="missing",
+    )
+    serve_parser = subparsers.add_parser(
+        "serve", help="serve PlayURLs like a tuner would"
+    )
+    serve_parser.add_argument(
+        "--port", type=int, default=5004, help="port to listen on", dest="port"
+    )
+    serve_parser.add_argument(
+        "-e",
+        type=int,
+        default=10,
+        help="number of episodes per series to list",
+        dest="episodes",
+    )
+    run_parser = subparsers.add_parser(
+        "run", help="time each script at several library sizes"
+    )
+    run_parser.add_argument(
+        "--sizes",
+        type=size,
+        nargs="+",
+        default=[(10, 10), (100, 10), (100, 100)],
+        help="library sizes as SERIESxEPISODES",
+        dest="sizes",
+    )
+    run_parser.add_argument(
+        "-j",
+        type=int,
+        default=8,
+        help="number of recordings to parse and probe concurrently",
+        dest="jobs",
+    )
+    run_parser.add_argument(
+        "--max-per-host",
+        type=int,
+        default=2,
+        help="maximum number of concurrent requests to the tuner",
+        dest="max_per_host",
+    )
+    run_parser.add_argument(
+        "--packets",
+        type=int,
+        default=16,
+        help="number of MPEG-TS packets in each video file",
+        dest="packets",
+    )
+    run_parser.add_argument(
+        "--probe-each",
+        action="store_true",
+        help="probe each PlayURL instead of fetching each series' episode list",
+        dest="probe_each",
+    )
+    run_parser.add_argument(
+        "--bulk-load",
+        choices=Library.BULK_JOURNAL_MODES,
+        help="import with this journal mode, relaxed syncing and deferred indexes",
+        dest="bulk_load",
+    )
+    run_parser.add_argument(
+        "--keep",
+        help="directory to generate the libraries in",
+        dest="keep",
+    )
+    for subparser in (serve_parser, run_parser):
+        subparser.add_argument(
+            "--missing",
+            type=float,
+            default=0.1,
+            help="fraction of PlayURLs that return 404",
+            dest="missing",
+        )
+        subparser.add_argument(
+            "--busy",
+            type=float,
+            default=0.0,
+            help="fraction of requests that return 503",
+            dest="busy",
+        )
+        subparser.add_argument(
+            "--latency",
+            type=float,
+            default=0.0,
+            help="seconds to wait before each response",
+            dest="latency",
+        )
+    parser_parser = subparsers.add_parser(
+        "parser", help="compare the path parsers with the regexes they replaced"
+    )
+    parser_parser.add_argument(
+        "--count",
+        type=int,
+        default=10000,
+        help="number of recordings to parse",
+        dest="count",
+    )
+    parser_parser.add_argument(
+        "--depth",
+        type=int,
+        default=8,
+        help="number of folders above the library",
+        dest="depth",
+    )
+    parser_parser.add_argument(
+        "--title-length",
+        type=int,
+        default=60,
+        help="length of each series title",
+        dest="title_length",
+    )
+    parser_parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="number of timing runs to take the best of",
+        dest="repeat",
+    )
+    parsed = parser.parse_args()
+    match parsed.command:
+        case "generate":
+            print(
+                generate(
+                    parsed.dir,
+                    parsed.series,
+                    parsed.episodes,
+                    parsed.layout,
+                    parsed.base_url,
+                    parsed.packets,
+                    parsed.missing,
+                )
+            )
+        case "serve":
+            tuner = Tuner(
+                ("127.0.0.1", parsed.port),
+                parsed.missing,
+                parsed.busy,
+                parsed.latency,
+                parsed.episodes,
+            )
+            print(tuner.base_url)
+            with tuner:
+                tuner.serve_forever()
+        case "run":
+            run(
+                parsed.sizes,
+                parsed.missing,
+                parsed.busy,
+                parsed.latency,
+                parsed.jobs,
+                parsed.max_per_host,
+                parsed.packets,
+                parsed.keep,
+                parsed.probe_each,
+                parsed.bulk_load,
+            )
+        case "parser":
+            if not parser_benchmark(
+                parsed.count, parsed.depth, parsed.title_length, parsed.repeat
+            ):
+                sys.exit(1)
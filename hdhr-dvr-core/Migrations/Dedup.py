@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+import argparse
+import concurrent.futures
+import hashlib
+import os
+import sqlite3
+import typing
+
+import Library
+import Scrub
+import Stats
+from Library import DeleteReason, DownloadReason
+
+BLOCK_SIZE = 1 << 20
+
+
+class Row(typing.NamedTuple):
+    Id: int
+    Metadata_ProgramId: str
+    DownloadReason: DownloadReason
+    DeleteReason: DeleteReason
+
+
+class Recording(typing.NamedTuple):
+    path: str
+    size: int
+    rows: list[Row]
+
+
+class Group(typing.NamedTuple):
+    title: str
+    recordings: list[Recording]
+    identical: bool
+
+
+def load_rows(conn: sqlite3.Connection) -> dict[int, Row]:
+    return {
+        id: Row(id, program_id, DownloadReason(download_reason), DeleteReason(reason))
+        for id, program_id, download_reason, reason in conn.execute(
+            "SELECT `Id`, `Metadata_ProgramId`, `DownloadReason`, `DeleteReason`"
+            " FROM `Episodes`"
+        )
+    }
+
+
+def find_recordings(dir: str, conn: sqlite3.Connection) -> list[Recording]:
+    with Stats.phase("load"):
+        entries = Scrub.load_entries(conn)
+        rows = load_rows(conn)
+    recordings: list[Recording] = []
+    for directory in Library.walk(dir):
+        for entry in directory.files:
+            if os.path.splitext(entry.name)[1].lower() not in Scrub.MEDIA_EXTENSIONS:
+                continue
+            try:
+                size = entry.stat().st_size
+            except OSError:
+                continue
+            path = Library.parse_path(entry.path)
+            matched = (
+                Scrub.match_entries(path, Scrub.lookup(path, entries))
+                if path is not None
+                else []
+            )
+            recordings.append(
+                Recording(entry.path, size, [rows[e.Id] for e in matched])
+            )
+    return recordings
+
+
+def partial_hash(recording: Recording) -> bytes | None:
+    digest = hashlib.blake2b()
+    try:
+        with open(recording.path, "rb") as f:
+            digest.update(f.read(BLOCK_SIZE))
+            if recording.size > BLOCK_SIZE:
+                f.seek(max(BLOCK_SIZE, recording.size - BLOCK_SIZE))
+                digest.update(f.read(BLOCK_SIZE))
+    except OSError:
+        return None
+    return digest.digest()
+
+
+def full_hash(recording: Recording) -> bytes | None:
+    digest = hashlib.blake2b()
+    buffer = bytearray(BLOCK_SIZE)
+    view = memoryview(buffer)
+    try:
+        with open(recording.path, "rb", buffering=0) as f:
+            while (n := f.readinto(buffer)) > 0:
+                digest.update(view[:n])
+    except OSError:
+        return None
+    return digest.digest()
+
+
+def split_groups(
+    groups: list[list[Recording]],
+    key: typing.Callable[[Recording], bytes | None],
+    jobs: int = 8,
+) -> list[list[Recording]]:
+    def hash_one(recording: Recording) -> bytes | None:
+        digest = key(recording)
+        Stats.progress()
+        return digest
+
+    Stats.expect("files", sum(len(group) for group in groups))
+    with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+        digests = iter(
+            list(
+                executor.map(
+                    hash_one, [recording for group in groups for recording in group]
+                )
+            )
+        )
+    split: dict[tuple[int, bytes], list[Recording]] = {}
+    for i, group in enumerate(groups):
+        for recording in group:
+            digest = next(digests)
+            if digest is not None:
+                split.setdefault((i, digest), []).append(recording)
+    return [group for group in split.values() if len(group) > 1]
+
+
+def find_duplicates(recordings: list[Recording], jobs: int = 8) -> list[Group]:
+    by_size: dict[int, list[Recording]] = {}
+    for recording in recordings:
+        if recording.size > 0:
+            by_size.setdefault(recording.size, []).append(recording)
+    candidates = [group for group in by_size.values() if len(group) > 1]
+    Stats.count("size collisions", sum(len(group) for group in candidates))
+    with Stats.phase("partial hash"):
+        candidates = split_groups(candidates, partial_hash, jobs)
+    Stats.count("partial collisions", sum(len(group) for group in candidates))
+    with Stats.phase("full hash"):
+        identical = [
+            group for group in candidates if group[0].size <= 2 * BLOCK_SIZE
+        ] + split_groups(
+            [group for group in candidates if group[0].size > 2 * BLOCK_SIZE],
+            full_hash,
+            jobs,
+        )
+    groups = [
+        Group(f"Identical recordings of {group[0].size} bytes", group, True)
+        for group in identical
+    ]
+    copies = {
+        recording.path: i for i, group in enumerate(identical) for recording in group
+    }
+    by_program: dict[str, list[Recording]] = {}
+    for recording in recordings:
+        for program_id in sorted({row.Metadata_ProgramId for row in recording.rows}):
+            by_program.setdefault(program_id, []).append(recording)
+    for program_id, group in sorted(by_program.items()):
+        distinct = {copies.get(recording.path, recording.path) for recording in group}
+        if len(distinct) > 1:
+            groups.append(Group(f"Recordings of program {program_id}", group, False))
+    for duplicate in groups:
+        duplicate.recordings.sort(key=lambda recording: recording.path)
+    return sorted(
+        groups, key=lambda group: (not group.identical, group.recordings[0].path)
+    )
+
+
+def report(groups: list[Group]) -> None:
+    for group in groups:
+        print(group.title)
+        for recording in group.recordings:
+            print(f"    {recording.path} ({recording.size} bytes)")
+            for row in recording.rows:
+                print(
+                    f"        Episode {row.Id}: {row.Metadata_ProgramId},"
+                    f" {row.DownloadReason.name}, {row.DeleteReason.name}"
+                )
+            if len(recording.rows) == 0:
+                print("        No database entry")
+    identical = [group for group in groups if group.identical]
+    copies = sum(len(group.recordings) - 1 for group in identical)
+    wasted = sum(
+        group.recordings[0].size * (len(group.recordings) - 1) for group in identical
+    )
+    print(
+        f"{copies} identical copies using {wasted} bytes,"
+        f" {len(groups) - len(identical)} programs recorded more than once"
+    )
+
+
+def dedup(dir: str, jobs: int = 8) -> None:
+    with Library.connect(dir, read_only=True) as conn:
+        recordings = find_recordings(dir, conn)
+    Stats.count("recordings", len(recordings))
+    groups = find_duplicates(recordings, jobs)
+    Stats.count("duplicate groups", len(groups))
+    report(groups)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Find duplicate recordings and the database rows that use them"
+    )
+    parser.add_argument("dir", help="root directory of library")
+    parser.add_argument(
+        "-j",
+        type=int,
+        default=8,
+        help="number of files to hash concurrently",
+        dest="jobs",
+    )
+    Stats.add_arguments(parser)
+    parsed = parser.parse_args()
+    with Stats.collect(parsed.stats, parsed.profile):
+        dedup(parsed.dir, parsed.jobs)
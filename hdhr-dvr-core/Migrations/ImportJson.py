@@ -1,35 +1,25 @@
 #!/usr/bin/env python
 import argparse
+import concurrent.futures
+import contextlib
 import datetime
-import enum
+import hashlib
+import http.client
 import itertools
 import json
 import os
+import queue
 import sqlite3
+import sys
+import threading
 import time
-import traceback
 import typing
 import urllib.error
-import urllib.request
 
-
-class DeleteReason(enum.IntEnum):
-    NotDeleted = 0
-    ReDownloaded = 1
-    Downloaded = 2
-    OneDayPassed = 3
-    OneWeekPassed = 4
-    Deleted = 5
-
-
-class DownloadReason(enum.IntEnum):
-    New = 0
-    DownloadInterrupted = 1
-
-
-class RecordingCategory(enum.IntEnum):
-    Movie = 0
-    Series = 1
+import Library
+import Probe
+import Stats
+from Library import DeleteReason, DownloadReason, RecordingCategory
 
 
 class Series(typing.NamedTuple):
@@ -96,26 +86,230 @@ def gettime(value: int | str) -> datetime.datetime:
             return datetime.datetime.fromisoformat(value)
 
 
-def parse(video_path: str, storage_path: str, episode_path: str) -> Episode:
-    with open(storage_path, "r") as f:
-        storage = json.load(f)
-    with open(episode_path, "r") as f:
-        episode = json.load(f)
-    play_url = get(episode, "PlayURL", "PlayUrl")
-    delete_reason = None
-    while delete_reason is None:
+class EpisodeList(typing.NamedTuple):
+    program_ids: frozenset[str]
+    play_urls: frozenset[str]
+    checked_at: float | None = None
+
+
+class ProbeCache:
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        prober: Probe.Prober,
+        ttl: float = 86400.0,
+    ) -> None:
+        self.conn = conn
+        self.prober = prober
+        self.ttl = ttl
+        self.results: dict[str, tuple[int, float]] = {}
+        if ttl > 0:
+            try:
+                self.results = {
+                    play_url: (status, checked_at)
+                    for play_url, status, checked_at in conn.execute(
+                        "SELECT `PlayUrl`, `Status`, `CheckedAt`"
+                        " FROM `ImportJsonProbeCache` WHERE `CheckedAt` >= ?",
+                        (time.time() - ttl,),
+                    )
+                }
+            except sqlite3.OperationalError:
+                pass
+        self.listings: dict[str, EpisodeList] = {}
+        if ttl > 0:
+            try:
+                self.listings = {
+                    url: EpisodeList(
+                        frozenset(json.loads(program_ids)),
+                        frozenset(json.loads(play_urls)),
+                        checked_at,
+                    )
+                    for url, program_ids, play_urls, checked_at in conn.execute(
+                        "SELECT `EpisodesUrl`, `ProgramIds`, `PlayUrls`, `CheckedAt`"
+                        " FROM `ImportJsonListingCache` WHERE `CheckedAt` >= ?",
+                        (time.time() - ttl,),
+                    )
+                }
+            except sqlite3.OperationalError:
+                pass
+        self.lock = threading.Lock()
+        self.rows: list[tuple[str, int, float]] = []
+        self.listing_rows: list[tuple[str, str, str, float]] = []
+
+    def probe(self, url: str) -> int:
+        cached = self.results.get(url)
+        if cached is not None and cached[1] >= time.time() - self.ttl:
+            Stats.count("cached probes")
+            return cached[0]
+        status = self.prober.probe(url)
+        if 200 <= status < 300 or status == 404:
+            with self.lock:
+                self.rows.append((url, status, time.time()))
+        return status
+
+    def listing(self, url: str) -> EpisodeList | None:
+        cached = self.listings.get(url)
+        if (
+            cached is None
+            or cached.checked_at is None
+            or cached.checked_at < time.time() - self.ttl
+        ):
+            return None
+        Stats.count("cached listings")
+        return cached
+
+    def add_listing(self, url: str, listing: EpisodeList) -> None:
+        with self.lock:
+            self.listing_rows.append(
+                (
+                    url,
+                    json.dumps(sorted(listing.program_ids)),
+                    json.dumps(sorted(listing.play_urls)),
+                    time.time(),
+                )
+            )
+
+    def save(self) -> None:
+        with self.lock:
+            rows = self.rows
+            self.rows = []
+            listing_rows = self.listing_rows
+            self.listing_rows = []
+        with self.conn:
+            if len(rows) > 0:
+                self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS `ImportJsonProbeCache` ("
+                    "`PlayUrl` TEXT NOT NULL PRIMARY KEY, "
+                    "`Status` INTEGER NOT NULL, "
+                    "`CheckedAt` REAL NOT NULL"
+                    ")"
+                )
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO `ImportJsonProbeCache`"
+                    " (`PlayUrl`, `Status`, `CheckedAt`) VALUES (?, ?, ?)",
+                    rows,
+                )
+            if len(listing_rows) > 0:
+                self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS `ImportJsonListingCache` ("
+                    "`EpisodesUrl` TEXT NOT NULL PRIMARY KEY, "
+                    "`ProgramIds` TEXT NOT NULL, "
+                    "`PlayUrls` TEXT NOT NULL, "
+                    "`CheckedAt` REAL NOT NULL"
+                    ")"
+                )
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO `ImportJsonListingCache`"
+                    " (`EpisodesUrl`, `ProgramIds`, `PlayUrls`, `CheckedAt`)"
+                    " VALUES (?, ?, ?, ?)",
+                    listing_rows,
+                )
+
+
+class EpisodeLists:
+    def __init__(self, prober: Probe.Prober, cache: ProbeCache | None = None) -> None:
+        self.prober = prober
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.lists: dict[
+            tuple[str, bool], concurrent.futures.Future[EpisodeList | None]
+        ] = {}
+
+    def get(self, url: str, fresh: bool = False) -> EpisodeList | None:
+        with self.lock:
+            future = self.lists.get((url, fresh))
+            owner = future is None
+            if future is None:
+                future = concurrent.futures.Future()
+                self.lists[(url, fresh)] = future
+        if owner:
+            try:
+                future.set_result(self.load(url, fresh))
+            except BaseException as e:
+                future.set_exception(e)
+        return future.result()
+
+    def load(self, url: str, fresh: bool) -> EpisodeList | None:
+        if not fresh and self.cache is not None:
+            cached = self.cache.listing(url)
+            if cached is not None:
+                return cached
+        listing = self.fetch(url)
+        if listing is not None and self.cache is not None:
+            self.cache.add_listing(url, listing)
+        return listing
+
+    def fetch(self, url: str) -> EpisodeList | None:
+        status, data = self.prober.fetch(url)
+        if status != 200:
+            return None
         try:
-            with urllib.request.urlopen(play_url) as f:
+            episodes = json.loads(data)
+        except ValueError:
+            return None
+        if not isinstance(episodes, list):
+            return None
+        return EpisodeList(
+            program_ids=frozenset(
+                program_id
+                for e in episodes
+                if (program_id := get(e, "ProgramID", "ProgramId", None)) is not None
+            ),
+            play_urls=frozenset(
+                play_url
+                for e in episodes
+                if (play_url := get(e, "PlayURL", "PlayUrl", None)) is not None
+            ),
+        )
+
+
+def parse(
+    video_path: str,
+    storage_path: str,
+    episode_path: str,
+    prober: Probe.Prober | ProbeCache,
+    video_stat: os.stat_result | None = None,
+    episode_lists: EpisodeLists | None = None,
+) -> Episode:
+    with Stats.phase("json"):
+        with open(storage_path, "r") as f:
+            storage = json.load(f)
+        with open(episode_path, "r") as f:
+            episode = json.load(f)
+    if video_stat is None:
+        video_stat = os.stat(video_path)
+    play_url = get(episode, "PlayURL", "PlayUrl")
+    program_id = get(episode, "ProgramID", "ProgramId")
+    episodes_url = get(storage, "EpisodesURL", "Url")
+    listing = episode_lists.get(episodes_url) if episode_lists is not None else None
+    if (
+        episode_lists is not None
+        and listing is not None
+        and listing.checked_at is not None
+        and listing.checked_at < gettime(episode["RecordEndTime"]).timestamp()
+        and program_id not in listing.program_ids
+        and play_url not in listing.play_urls
+    ):
+        listing = episode_lists.get(episodes_url, True)
+    if listing is not None:
+        if program_id in listing.program_ids or play_url in listing.play_urls:
+            delete_reason = DeleteReason.NotDeleted
+        else:
+            delete_reason = DeleteReason.Downloaded
+    else:
+        match prober.probe(play_url):
+            case status if 200 <= status < 300:
                 delete_reason = DeleteReason.NotDeleted
-        except urllib.error.HTTPError as e:
-            match e.code:
-                case 404:
-                    delete_reason = DeleteReason.Downloaded
-                case 503:
-                    traceback.print_exc()
-                    time.sleep(1)
-                case _:
-                    raise
+            case 404:
+                delete_reason = DeleteReason.Downloaded
+            case status:
+                raise urllib.error.HTTPError(
+                    play_url,
+                    status,
+                    http.client.responses.get(status, ""),
+                    http.client.HTTPMessage(),
+                    None,
+                )
     return Episode(
         Series=Series(
             Metadata_SeriesId=get(storage, "SeriesID", "SeriesId"),
@@ -152,7 +346,7 @@ def parse(video_path: str, storage_path: str, episode_path: str) -> Episode:
         Metadata_MovieScore=get(episode, "MovieScore", None),
         Metadata_OriginalAirdate=gettime(get(episode, "OriginalAirdate", "StartTime")),
         Metadata_PosterUrl=get(episode, "PosterURL", "PosterUrl", None),
-        Metadata_ProgramId=get(episode, "ProgramID", "ProgramId"),
+        Metadata_ProgramId=program_id,
         Metadata_RecordEndTime=gettime(episode["RecordEndTime"]),
         Metadata_RecordError=get(episode, "RecordError", None),
         Metadata_RecordStartTime=gettime(episode["RecordStartTime"]),
@@ -166,7 +360,7 @@ def parse(video_path: str, storage_path: str, episode_path: str) -> Episode:
         Metadata_CmdUrl=get(episode, "CmdURL", "CmdUrl"),
         DownloadInterrupted=False,
         DownloadStarted=datetime.datetime.fromtimestamp(
-            os.stat(video_path).st_birthtime
+            getattr(video_stat, "st_birthtime", video_stat.st_mtime)
         ),
         DownloadReason=DownloadReason.New,
         DeleteReason=delete_reason,
@@ -174,191 +368,905 @@ def parse(video_path: str, storage_path: str, episode_path: str) -> Episode:
     )
 
 
-def import_json(dir: str, dry_run: bool = False, verbose: bool = False) -> None:
-    with sqlite3.connect(
-        os.path.join(dir, "Com.ZachDeibert.MediaTools.Hdhr.Dvr.Jellyfin.db")
-    ) as conn:
-        res = conn.execute("SELECT `Id` FROM `Series` ORDER BY `Id` DESC LIMIT 1")
-        row = res.fetchone()
-        (max_series_id,) = row if row is not None else (0,)
-        for dirpath, _, filenames in list(os.walk(dir)):
-            recycled_dir = os.path.join(
-                dir, ".recycle-bin", os.path.relpath(dirpath, dir)
+class Sidecars(typing.NamedTuple):
+    video_path: str
+    episode_path: str
+    storage_path: str
+    recycled_episode: str
+    recycled_storage: str
+    video_entry: os.DirEntry[str] | None = None
+
+
+def sidecars_for(
+    dir: str, video_path: str, video_entry: os.DirEntry[str] | None = None
+) -> Sidecars:
+    dirpath, video_filename = os.path.split(video_path)
+    recycled_dir = os.path.join(dir, Library.RECYCLE_BIN, os.path.relpath(dirpath, dir))
+    return Sidecars(
+        video_path=video_path,
+        episode_path=f"{video_path}.episode.json",
+        storage_path=f"{video_path}.storage.json",
+        recycled_episode=os.path.join(recycled_dir, f"{video_filename}.episode.json"),
+        recycled_storage=os.path.join(recycled_dir, f"{video_filename}.storage.json"),
+        video_entry=video_entry,
+    )
+
+
+SIDECAR_SUFFIXES = (".episode.json", ".storage.json")
+RETRY_DELAY = 60.0
+
+
+def find_sidecars(
+    dir: str,
+    skip: typing.Container[str] = (),
+    directories: typing.Iterable[Library.Directory] | None = None,
+) -> typing.Iterator[Sidecars]:
+    for directory in directories if directories is not None else Library.walk(dir):
+        if directory.relpath in skip:
+            continue
+        filenames = {entry.name for entry in directory.files}
+        for video_entry in directory.files:
+            if video_entry.name.endswith(".json"):
+                continue
+            if (
+                f"{video_entry.name}.episode.json" in filenames
+                and f"{video_entry.name}.storage.json" in filenames
+            ):
+                Stats.discover()
+                yield sidecars_for(dir, video_entry.path, video_entry)
+
+
+T = typing.TypeVar("T")
+R = typing.TypeVar("R")
+
+
+def pipeline(
+    items: typing.Iterable[T],
+    work: typing.Callable[[T], R],
+    workers: int,
+    capacity: int,
+) -> typing.Iterator[tuple[T, concurrent.futures.Future[R]]]:
+    in_flight = threading.BoundedSemaphore(capacity)
+    stop = threading.Event()
+    inbox: queue.Queue[tuple[int, T] | None] = queue.Queue(capacity)
+    outbox: queue.Queue[tuple[int, T | None, concurrent.futures.Future[R]]] = (
+        queue.Queue()
+    )
+
+    def walk() -> None:
+        count = 0
+        done: concurrent.futures.Future[R] = concurrent.futures.Future()
+        try:
+            for item in items:
+                while not in_flight.acquire(timeout=0.1):
+                    if stop.is_set():
+                        return
+                inbox.put((count, item))
+                count += 1
+        except BaseException as e:
+            done.set_exception(e)
+        finally:
+            for _ in range(workers):
+                inbox.put(None)
+            outbox.put((count, None, done))
+
+    def process() -> None:
+        while (job := inbox.get()) is not None:
+            seq, item = job
+            future: concurrent.futures.Future[R] = concurrent.futures.Future()
+            if not stop.is_set():
+                try:
+                    future.set_result(work(item))
+                except BaseException as e:
+                    future.set_exception(e)
+            outbox.put((seq, item, future))
+
+    threads = [threading.Thread(target=walk, daemon=True)] + [
+        threading.Thread(target=process, daemon=True) for _ in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        ready: dict[int, tuple[T, concurrent.futures.Future[R]]] = {}
+        total: int | None = None
+        seq = 0
+        while total is None or seq < total:
+            while seq not in ready and (total is None or seq < total):
+                i, item, future = outbox.get()
+                if item is None:
+                    total = i
+                    if future.done():
+                        future.result()
+                else:
+                    ready[i] = (item, future)
+            if seq in ready:
+                yield ready.pop(seq)
+                in_flight.release()
+                seq += 1
+    finally:
+        stop.set()
+
+
+SERIES_KEY_COLUMNS = (
+    "Metadata_SeriesId",
+    "Metadata_Title",
+    "Metadata_Category",
+    "Metadata_ImageUrl",
+    "Metadata_PosterUrl",
+    "Metadata_IsNew",
+    "Metadata_Url",
+)
+SERIES_COLUMNS = (
+    "Id",
+    "Metadata_SeriesId",
+    "Metadata_Title",
+    "Metadata_Category",
+    "Metadata_ImageUrl",
+    "Metadata_PosterUrl",
+    "Metadata_StartTime",
+    "Metadata_IsNew",
+    "Metadata_Url",
+)
+EPISODE_COLUMNS = (
+    "SeriesId",
+    "SeriesStartTime",
+    "Metadata_Category",
+    "Metadata_ChannelImageUrl",
+    "Metadata_ChannelName",
+    "Metadata_ChannelNumber",
+    "Metadata_EndTime",
+    "Metadata_EpisodeNumber",
+    "Metadata_EpisodeTitle",
+    "Metadata_FirstAiring",
+    "Metadata_ImageUrl",
+    "Metadata_MovieScore",
+    "Metadata_OriginalAirdate",
+    "Metadata_PosterUrl",
+    "Metadata_ProgramId",
+    "Metadata_RecordEndTime",
+    "Metadata_RecordError",
+    "Metadata_RecordStartTime",
+    "Metadata_RecordSuccess",
+    "Metadata_SeriesId",
+    "Metadata_StartTime",
+    "Metadata_Synopsis",
+    "Metadata_Title",
+    "Metadata_Filename",
+    "Metadata_PlayUrl",
+    "Metadata_CmdUrl",
+    "DownloadInterrupted",
+    "DownloadStarted",
+    "DownloadReason",
+    "DeleteReason",
+    "ReRecordable",
+)
+
+
+JOURNAL_COLUMNS = ("Path", "IsDirectory")
+JOURNAL_SQL = (
+    "CREATE TABLE IF NOT EXISTS `ImportJsonJournal` ("
+    "`Path` TEXT NOT NULL PRIMARY KEY, "
+    "`IsDirectory` INTEGER NOT NULL"
+    ")"
+)
+LOADED_EXPORTS_SQL = (
+    "CREATE TABLE IF NOT EXISTS `ImportJsonLoadedExports` ("
+    "`Hash` TEXT NOT NULL PRIMARY KEY, "
+    "`LoadedAt` REAL NOT NULL"
+    ")"
+)
+EXPORT_FORMATS = ("sql", "ndjson")
+EXPORT_COLUMNS = {
+    "Series": SERIES_COLUMNS,
+    "Episodes": EPISODE_COLUMNS,
+    "ImportJsonJournal": JOURNAL_COLUMNS,
+}
+EXPORT_BUFFER = 1 << 20
+
+
+def timestamp(value: datetime.datetime) -> str:
+    return f"{value.isoformat(' ', 'seconds')}+00:00"
+
+
+def insert_sql(table: str, columns: tuple[str, ...], replace: bool = False) -> str:
+    return (
+        f"INSERT {'OR REPLACE ' if replace else ''}INTO `{table}` ("
+        + ", ".join(f"`{c}`" for c in columns)
+        + ") VALUES ("
+        + ", ".join("?" for _ in columns)
+        + ")"
+    )
+
+
+def sql_literal(value: typing.Any) -> str:
+    match value:
+        case None:
+            return "NULL"
+        case bool() | int():
+            return str(int(value))
+        case float():
+            return repr(value)
+        case str():
+            return "'" + value.replace("'", "''") + "'"
+        case bytes():
+            return f"X'{value.hex()}'"
+    raise TypeError(f"Cannot write {type(value).__name__} as SQL")
+
+
+def format_sql(sql: str, values: tuple[typing.Any, ...]) -> str:
+    return "".join(
+        s
+        for s in itertools.chain(
+            *itertools.zip_longest(sql.split("?"), (sql_literal(v) for v in values))
+        )
+        if s is not None
+    )
+
+
+class Export:
+    def __init__(self, path: str, format: str = "sql") -> None:
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format {format}")
+        self.format = format
+        self.file = open(path, "w", buffering=EXPORT_BUFFER, encoding="utf-8")
+        if format == "sql":
+            self.file.write(f"BEGIN;\n{JOURNAL_SQL};\n")
+
+    def __enter__(self) -> "Export":
+        return self
+
+    def __exit__(self, exc_type, *_) -> None:
+        self.close(exc_type is None)
+
+    def write(
+        self,
+        table: str,
+        columns: tuple[str, ...],
+        rows: list[tuple[typing.Any, ...]],
+    ) -> None:
+        if self.format == "sql":
+            sql = insert_sql(table, columns, table == "ImportJsonJournal")
+            self.file.writelines(f"{format_sql(sql, row)};\n" for row in rows)
+        else:
+            self.file.writelines(
+                json.dumps({"table": table, "row": dict(zip(columns, row))}) + "\n"
+                for row in rows
             )
-            if not dry_run:
-                os.makedirs(recycled_dir, exist_ok=True)
-            for video_filename in (f for f in filenames if not f.endswith(".json")):
-                episode_filename = f"{video_filename}.episode.json"
-                storage_filename = f"{video_filename}.storage.json"
-                if episode_filename in filenames and storage_filename in filenames:
-                    video_path = os.path.join(dirpath, video_filename)
-                    episode_path = os.path.join(dirpath, episode_filename)
-                    storage_path = os.path.join(dirpath, storage_filename)
-                    if verbose:
-                        print(video_path)
-                    episode = parse(video_path, storage_path, episode_path)
-                    res = conn.execute(
-                        "SELECT `Id` FROM `Series`"
-                        " WHERE `Metadata_SeriesId` = ?"
-                        " AND `Metadata_Title` = ?"
-                        " AND `Metadata_Category` = ?"
-                        " AND `Metadata_ImageUrl` = ?"
-                        f" AND `Metadata_PosterUrl` {'ISNULL' if episode.Series.Metadata_PosterUrl is None else '= ?'}"
-                        " AND `Metadata_IsNew` = ?"
-                        " AND `Metadata_Url` = ?",
-                        tuple(
-                            v
-                            for v in (
-                                episode.Series.Metadata_SeriesId,
-                                episode.Series.Metadata_Title,
-                                episode.Series.Metadata_Category.value,
-                                episode.Series.Metadata_ImageUrl,
-                                episode.Series.Metadata_PosterUrl,
-                                int(episode.Series.Metadata_IsNew),
-                                episode.Series.Metadata_Url,
-                            )
-                            if v is not None
-                        ),
+
+    def close(self, complete: bool = True) -> None:
+        if complete:
+            self.file.write(
+                "COMMIT;\n" if self.format == "sql" else '{"complete": true}\n'
+            )
+        self.file.close()
+
+
+def export_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while len(chunk := f.read(EXPORT_BUFFER)) > 0:
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def export_loaded(conn: sqlite3.Connection, hash: str) -> bool:
+    try:
+        return (
+            conn.execute(
+                "SELECT 1 FROM `ImportJsonLoadedExports` WHERE `Hash` = ?", (hash,)
+            ).fetchone()
+            is not None
+        )
+    except sqlite3.OperationalError:
+        return False
+
+
+def record_export(conn: sqlite3.Connection, hash: str) -> None:
+    conn.execute(LOADED_EXPORTS_SQL)
+    conn.execute(
+        "INSERT INTO `ImportJsonLoadedExports` (`Hash`, `LoadedAt`) VALUES (?, ?)",
+        (hash, time.time()),
+    )
+
+
+def load_export(conn: sqlite3.Connection, path: str, format: str = "sql") -> None:
+    with Stats.phase("load"):
+        hash = export_hash(path)
+        if export_loaded(conn, hash):
+            raise ValueError(f"{path} has already been loaded")
+        with open(path, "r", encoding="utf-8") as f:
+            if format == "sql":
+                script = f.read()
+                if not script.endswith("COMMIT;\n"):
+                    raise ValueError(f"{path} is incomplete")
+                try:
+                    conn.executescript(script.removesuffix("COMMIT;\n"))
+                    record_export(conn, hash)
+                    conn.commit()
+                except BaseException:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    raise
+                return
+            records = (json.loads(line) for line in f)
+            complete = False
+            with conn:
+                record_export(conn, hash)
+                conn.execute(JOURNAL_SQL)
+                for table, group in itertools.groupby(
+                    records, lambda r: r.get("table")
+                ):
+                    if table is None:
+                        complete = any(r.get("complete") for r in group)
+                        continue
+                    columns = EXPORT_COLUMNS[table]
+                    conn.executemany(
+                        insert_sql(table, columns, table == "ImportJsonJournal"),
+                        (tuple(r["row"][c] for c in columns) for r in group),
                     )
-                    row = res.fetchone()
-                    if row is not None:
-                        (series_id,) = row
+                if not complete:
+                    raise ValueError(f"{path} is incomplete")
+
+
+def series_key(series: Series) -> tuple[typing.Any, ...]:
+    return (
+        series.Metadata_SeriesId,
+        series.Metadata_Title,
+        series.Metadata_Category.value,
+        series.Metadata_ImageUrl,
+        series.Metadata_PosterUrl,
+        int(series.Metadata_IsNew),
+        series.Metadata_Url,
+    )
+
+
+def series_values(series_id: int, series: Series) -> tuple[typing.Any, ...]:
+    return (
+        series_id,
+        series.Metadata_SeriesId,
+        series.Metadata_Title,
+        series.Metadata_Category.value,
+        series.Metadata_ImageUrl,
+        series.Metadata_PosterUrl,
+        timestamp(series.Metadata_StartTime),
+        int(series.Metadata_IsNew),
+        series.Metadata_Url,
+    )
+
+
+def episode_values(series_id: int, episode: Episode) -> tuple[typing.Any, ...]:
+    return (
+        series_id,
+        timestamp(episode.Series.Metadata_StartTime),
+        episode.Metadata_Category.value,
+        episode.Metadata_ChannelImageUrl,
+        episode.Metadata_ChannelName,
+        episode.Metadata_ChannelNumber,
+        timestamp(episode.Metadata_EndTime),
+        episode.Metadata_EpisodeNumber,
+        episode.Metadata_EpisodeTitle,
+        int(episode.Metadata_FirstAiring),
+        episode.Metadata_ImageUrl,
+        episode.Metadata_MovieScore,
+        timestamp(episode.Metadata_OriginalAirdate),
+        episode.Metadata_PosterUrl,
+        episode.Metadata_ProgramId,
+        timestamp(episode.Metadata_RecordEndTime),
+        episode.Metadata_RecordError,
+        timestamp(episode.Metadata_RecordStartTime),
+        int(episode.Metadata_RecordSuccess),
+        episode.Metadata_SeriesId,
+        timestamp(episode.Metadata_StartTime),
+        episode.Metadata_Synopsis,
+        episode.Metadata_Title,
+        episode.Metadata_Filename,
+        episode.Metadata_PlayUrl,
+        episode.Metadata_CmdUrl,
+        int(episode.DownloadInterrupted),
+        timestamp(episode.DownloadStarted),
+        episode.DownloadReason.value,
+        episode.DeleteReason.value,
+        int(episode.ReRecordable),
+    )
+
+
+class BulkWriter:
+    def __init__(
+        self,
+        dir: str,
+        conn: sqlite3.Connection,
+        dry_run: bool = False,
+        batch_size: int = 1000,
+        resume: bool = True,
+        track_dirs: bool = True,
+        export: Export | None = None,
+    ) -> None:
+        self.dir = dir
+        self.conn = conn
+        self.dry_run = dry_run
+        self.batch_size = batch_size
+        self.track_dirs = track_dirs
+        self.export = export
+        self.series_ids: dict[tuple[typing.Any, ...], int] = {}
+        self.max_series_id = 0
+        for row in conn.execute(
+            "SELECT `Id`, "
+            + ", ".join(f"`{c}`" for c in SERIES_KEY_COLUMNS)
+            + " FROM `Series` ORDER BY `Id`"
+        ):
+            self.series_ids.setdefault(tuple(row[1:]), row[0])
+            self.max_series_id = max(self.max_series_id, row[0])
+        if not dry_run:
+            with conn:
+                conn.execute(JOURNAL_SQL)
+                if not resume:
+                    conn.execute("DELETE FROM `ImportJsonJournal`")
+        self.committed_pairs: set[str] = set()
+        self.completed_dirs: set[str] = set()
+        if resume:
+            try:
+                for path, is_directory in conn.execute(
+                    "SELECT `Path`, `IsDirectory` FROM `ImportJsonJournal`"
+                ):
+                    if is_directory:
+                        self.completed_dirs.add(os.path.normpath(path))
                     else:
-                        max_series_id += 1
-                        series_id = max_series_id
-                        sql = (
-                            "INSERT INTO `Series` ("
-                            "`Id`, "
-                            "`Metadata_SeriesId`, "
-                            "`Metadata_Title`, "
-                            "`Metadata_Category`, "
-                            "`Metadata_ImageUrl`, "
-                            "`Metadata_PosterUrl`, "
-                            "`Metadata_StartTime`, "
-                            "`Metadata_IsNew`, "
-                            "`Metadata_Url`"
-                            ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
-                        )
-                        values = (
-                            series_id,
-                            episode.Series.Metadata_SeriesId,
-                            episode.Series.Metadata_Title,
-                            episode.Series.Metadata_Category.value,
-                            episode.Series.Metadata_ImageUrl,
-                            episode.Series.Metadata_PosterUrl,
-                            f"{episode.Series.Metadata_StartTime.isoformat(' ', 'seconds')}+00:00",
-                            int(episode.Series.Metadata_IsNew),
-                            episode.Series.Metadata_Url,
-                        )
-                        if dry_run:
-                            print(
-                                "".join(
-                                    s
-                                    for s in itertools.chain(
-                                        *itertools.zip_longest(
-                                            sql.split("?"), (repr(v) for v in values)
-                                        )
-                                    )
-                                    if s is not None
-                                )
-                            )
-                        else:
-                            conn.execute(sql, values)
-                    sql = (
-                        "INSERT INTO `Episodes` ("
-                        "`SeriesId`, "
-                        "`SeriesStartTime`, "
-                        "`Metadata_Category`, "
-                        "`Metadata_ChannelImageUrl`, "
-                        "`Metadata_ChannelName`, "
-                        "`Metadata_ChannelNumber`, "
-                        "`Metadata_EndTime`, "
-                        "`Metadata_EpisodeNumber`, "
-                        "`Metadata_EpisodeTitle`, "
-                        "`Metadata_FirstAiring`, "
-                        "`Metadata_ImageUrl`, "
-                        "`Metadata_MovieScore`, "
-                        "`Metadata_OriginalAirdate`, "
-                        "`Metadata_PosterUrl`, "
-                        "`Metadata_ProgramId`, "
-                        "`Metadata_RecordEndTime`, "
-                        "`Metadata_RecordError`, "
-                        "`Metadata_RecordStartTime`, "
-                        "`Metadata_RecordSuccess`, "
-                        "`Metadata_SeriesId`, "
-                        "`Metadata_StartTime`, "
-                        "`Metadata_Synopsis`, "
-                        "`Metadata_Title`, "
-                        "`Metadata_Filename`, "
-                        "`Metadata_PlayUrl`, "
-                        "`Metadata_CmdUrl`, "
-                        "`DownloadInterrupted`, "
-                        "`DownloadStarted`, "
-                        "`DownloadReason`, "
-                        "`DeleteReason`, "
-                        "`ReRecordable`"
-                        ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                        self.committed_pairs.add(path)
+            except sqlite3.OperationalError:
+                pass
+        self.current_dir: str | None = None
+        self.series_rows: list[tuple[typing.Any, ...]] = []
+        self.episode_rows: list[tuple[typing.Any, ...]] = []
+        self.journal_rows: list[tuple[str, int]] = []
+        self.moves: list[tuple[str, str]] = []
+        self.recycled_dirs: set[str] = set()
+
+    def recover(self) -> list[str]:
+        recovered: list[str] = []
+        for path in sorted(self.committed_pairs):
+            sidecars = sidecars_for(self.dir, os.path.join(self.dir, path))
+            for src, dst in (
+                (sidecars.episode_path, sidecars.recycled_episode),
+                (sidecars.storage_path, sidecars.recycled_storage),
+            ):
+                if os.path.exists(src):
+                    if self.dry_run:
+                        print(f"mv {src} {dst}")
+                    else:
+                        self.move(src, dst)
+                    recovered.append(src)
+        return recovered
+
+    def move(self, src: str, dst: str) -> None:
+        recycled_dir = os.path.dirname(dst)
+        if recycled_dir not in self.recycled_dirs:
+            os.makedirs(recycled_dir, exist_ok=True)
+            self.recycled_dirs.add(recycled_dir)
+        os.rename(src, dst)
+
+    def add(self, sidecars: Sidecars, episode: Episode) -> None:
+        key = series_key(episode.Series)
+        series_id = self.series_ids.get(key)
+        if series_id is None:
+            self.max_series_id += 1
+            series_id = self.max_series_id
+            self.series_ids[key] = series_id
+            self.series_rows.append(series_values(series_id, episode.Series))
+            if self.dry_run and self.export is None:
+                print(
+                    format_sql(
+                        insert_sql("Series", SERIES_COLUMNS), self.series_rows[-1]
                     )
-                    values = (
-                        series_id,
-                        f"{episode.Series.Metadata_StartTime.isoformat(' ', 'seconds')}+00:00",
-                        episode.Metadata_Category.value,
-                        episode.Metadata_ChannelImageUrl,
-                        episode.Metadata_ChannelName,
-                        episode.Metadata_ChannelNumber,
-                        f"{episode.Metadata_EndTime.isoformat(' ', 'seconds')}+00:00",
-                        episode.Metadata_EpisodeNumber,
-                        episode.Metadata_EpisodeTitle,
-                        int(episode.Metadata_FirstAiring),
-                        episode.Metadata_ImageUrl,
-                        episode.Metadata_MovieScore,
-                        f"{episode.Metadata_OriginalAirdate.isoformat(' ', 'seconds')}+00:00",
-                        episode.Metadata_PosterUrl,
-                        episode.Metadata_ProgramId,
-                        f"{episode.Metadata_RecordEndTime.isoformat(' ', 'seconds')}+00:00",
-                        episode.Metadata_RecordError,
-                        f"{episode.Metadata_RecordStartTime.isoformat(' ', 'seconds')}+00:00",
-                        int(episode.Metadata_RecordSuccess),
-                        episode.Metadata_SeriesId,
-                        f"{episode.Metadata_StartTime.isoformat(' ', 'seconds')}+00:00",
-                        episode.Metadata_Synopsis,
-                        episode.Metadata_Title,
-                        episode.Metadata_Filename,
-                        episode.Metadata_PlayUrl,
-                        episode.Metadata_CmdUrl,
-                        int(episode.DownloadInterrupted),
-                        f"{episode.DownloadStarted.isoformat(' ', 'seconds')}+00:00",
-                        episode.DownloadReason.value,
-                        episode.DeleteReason.value,
-                        int(episode.ReRecordable),
+                    + ";"
+                )
+        self.episode_rows.append(episode_values(series_id, episode))
+        self.moves.append((sidecars.episode_path, sidecars.recycled_episode))
+        self.moves.append((sidecars.storage_path, sidecars.recycled_storage))
+        video_path = os.path.relpath(sidecars.video_path, self.dir)
+        video_dir = os.path.relpath(os.path.dirname(sidecars.video_path), self.dir)
+        if self.track_dirs and video_dir != self.current_dir:
+            if self.current_dir is not None:
+                self.journal_rows.append((self.current_dir, 1))
+            self.current_dir = video_dir
+        self.journal_rows.append((video_path, 0))
+        if self.dry_run and self.export is None:
+            print(
+                format_sql(
+                    insert_sql("Episodes", EPISODE_COLUMNS), self.episode_rows[-1]
+                )
+                + ";"
+            )
+            for src, dst in self.moves[-2:]:
+                print(f"mv {src} {dst}")
+        if len(self.episode_rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.export is not None:
+            with Stats.phase("export"):
+                self.export.write("Series", SERIES_COLUMNS, self.series_rows)
+                self.export.write("Episodes", EPISODE_COLUMNS, self.episode_rows)
+                self.export.write(
+                    "ImportJsonJournal",
+                    JOURNAL_COLUMNS,
+                    [row for row in self.journal_rows if not row[1]],
+                )
+        elif not self.dry_run:
+            with Stats.phase("sql"), self.conn:
+                self.conn.executemany(
+                    insert_sql("Series", SERIES_COLUMNS), self.series_rows
+                )
+                self.conn.executemany(
+                    insert_sql("Episodes", EPISODE_COLUMNS), self.episode_rows
+                )
+                self.conn.executemany(
+                    insert_sql("ImportJsonJournal", JOURNAL_COLUMNS, True),
+                    self.journal_rows,
+                )
+            Stats.count("rows inserted", len(self.series_rows) + len(self.episode_rows))
+            with Stats.phase("recycle"):
+                for src, dst in self.moves:
+                    self.move(src, dst)
+        self.series_rows.clear()
+        self.episode_rows.clear()
+        self.journal_rows.clear()
+        self.moves.clear()
+
+    def finish(self) -> None:
+        self.flush()
+        if not self.dry_run:
+            with self.conn:
+                self.conn.execute("DROP TABLE `ImportJsonJournal`")
+
+
+def import_sidecars(
+    writer: BulkWriter,
+    items: typing.Iterable[Sidecars],
+    cache: ProbeCache,
+    episode_lists: EpisodeLists | None = None,
+    verbose: bool = False,
+    jobs: int = 8,
+) -> set[str]:
+    consumed: set[str] = set()
+    for sidecars, future in pipeline(
+        items,
+        lambda s: parse(
+            s.video_path,
+            s.storage_path,
+            s.episode_path,
+            cache,
+            s.video_entry.stat() if s.video_entry is not None else None,
+            episode_lists,
+        ),
+        jobs,
+        jobs * 4,
+    ):
+        if verbose:
+            print(sidecars.video_path)
+        writer.add(sidecars, future.result())
+        consumed.add(sidecars.episode_path)
+        consumed.add(sidecars.storage_path)
+        Stats.progress()
+    writer.finish()
+    return consumed
+
+
+def import_library(
+    dir: str,
+    conn: sqlite3.Connection,
+    prober: Probe.Prober,
+    directories: typing.Iterable[Library.Directory] | None = None,
+    dry_run: bool = False,
+    verbose: bool = False,
+    jobs: int = 8,
+    batch_size: int = 1000,
+    resume: bool = True,
+    probe_ttl: float = 86400.0,
+    probe_each: bool = False,
+    export: Export | None = None,
+) -> set[str]:
+    writer = BulkWriter(
+        dir,
+        conn=conn,
+        dry_run=dry_run,
+        batch_size=batch_size,
+        resume=resume,
+        track_dirs=True,
+        export=export,
+    )
+    cache = ProbeCache(conn, prober, probe_ttl)
+    episode_lists = EpisodeLists(prober, cache) if not probe_each else None
+    consumed = set(writer.recover())
+    Stats.expect("recordings")
+    try:
+        consumed |= import_sidecars(
+            writer,
+            find_sidecars(dir, writer.completed_dirs, directories),
+            cache,
+            episode_lists,
+            verbose,
+            jobs,
+        )
+    finally:
+        cache.save()
+    return consumed
+
+
+def video_path_for(path: str) -> str:
+    for suffix in SIDECAR_SUFFIXES:
+        if path.endswith(suffix):
+            return path[: -len(suffix)]
+    return path
+
+
+def complete_sidecars(dir: str, video_path: str) -> Sidecars | None:
+    sidecars = sidecars_for(dir, video_path)
+    if not all(
+        os.path.isfile(path)
+        for path in (video_path, sidecars.episode_path, sidecars.storage_path)
+    ):
+        return None
+    return sidecars
+
+
+def watch_library(
+    dir: str,
+    conn: sqlite3.Connection,
+    prober: Probe.Prober,
+    dry_run: bool = False,
+    verbose: bool = False,
+    jobs: int = 8,
+    batch_size: int = 1000,
+    resume: bool = True,
+    probe_ttl: float = 86400.0,
+    probe_each: bool = False,
+    bulk_load: str | None = None,
+    debounce: float = 2.0,
+    export: Export | None = None,
+) -> None:
+    import Inotify
+
+    watch_mask = (
+        Inotify.IN_CLOSE_WRITE
+        | Inotify.IN_MOVED_TO
+        | Inotify.IN_CREATE
+        | Inotify.IN_ONLYDIR
+    )
+    with Inotify.Inotify() as inotify:
+        pending: dict[str, float] = {}
+
+        def watch_tree(root: str) -> typing.Iterator[Library.Directory]:
+            for directory in Library.walk(root):
+                try:
+                    inotify.add(directory.path, watch_mask)
+                except (FileNotFoundError, NotADirectoryError):
+                    continue
+                yield directory
+
+        def rescan(bulk_load: str | None = None) -> None:
+            pending.clear()
+            with (
+                Stats.phase("rescan"),
+                (
+                    Library.bulk_load(conn, bulk_load)
+                    if bulk_load is not None and not dry_run
+                    else contextlib.nullcontext()
+                ),
+            ):
+                import_library(
+                    dir,
+                    conn=conn,
+                    prober=prober,
+                    directories=watch_tree(dir),
+                    dry_run=dry_run,
+                    verbose=verbose,
+                    jobs=jobs,
+                    batch_size=batch_size,
+                    resume=resume,
+                    probe_ttl=probe_ttl,
+                    probe_each=probe_each,
+                    export=export,
+                )
+
+        def import_batch(batch: list[Sidecars]) -> bool:
+            try:
+                with Stats.phase("watch import"):
+                    import_sidecars(
+                        BulkWriter(
+                            dir,
+                            conn=conn,
+                            dry_run=dry_run,
+                            batch_size=batch_size,
+                            resume=False,
+                            track_dirs=False,
+                            export=export,
+                        ),
+                        batch,
+                        cache,
+                        EpisodeLists(prober, cache) if not probe_each else None,
+                        verbose,
+                        jobs,
                     )
-                    recycled_episode = os.path.join(recycled_dir, episode_filename)
-                    recycled_storage = os.path.join(recycled_dir, storage_filename)
-                    if dry_run:
-                        print(
-                            "".join(
-                                s
-                                for s in itertools.chain(
-                                    *itertools.zip_longest(
-                                        sql.split("?"), (repr(v) for v in values)
-                                    )
-                                )
-                                if s is not None
-                            )
-                        )
-                        print(f"mv {episode_path} {recycled_episode}")
-                        print(f"mv {storage_path} {recycled_storage}")
-                    else:
-                        conn.execute(sql, values)
-                        os.rename(episode_path, recycled_episode)
-                        os.rename(storage_path, recycled_storage)
+            except (OSError, ValueError, KeyError) as e:
+                print(
+                    f"Failed to import {', '.join(s.video_path for s in batch)}: {e}",
+                    file=sys.stderr,
+                )
+                return False
+            finally:
+                cache.save()
+            Stats.count("watched imports", len(batch))
+            return True
+
+        rescan(bulk_load)
+        cache = ProbeCache(conn, prober, probe_ttl)
+        while True:
+            now = time.monotonic()
+            batch: list[Sidecars] = []
+            for video_path in sorted(p for p, due in pending.items() if due <= now):
+                del pending[video_path]
+                sidecars = complete_sidecars(dir, video_path)
+                if sidecars is not None:
+                    batch.append(sidecars)
+            if len(batch) > 0 and not import_batch(batch):
+                for sidecars in batch:
+                    if len(batch) == 1 or not import_batch([sidecars]):
+                        pending[sidecars.video_path] = now + RETRY_DELAY
+            timeout = (
+                max(0.0, min(pending.values()) - time.monotonic())
+                if len(pending) > 0
+                else None
+            )
+            for event in inotify.read(timeout):
+                if event.mask & Inotify.IN_Q_OVERFLOW:
+                    Stats.count("overflows")
+                    rescan()
+                    break
+                if event.path is None or event.name == "":
+                    continue
+                path = os.path.join(event.path, event.name)
+                due = time.monotonic() + debounce
+                if event.mask & Inotify.IN_ISDIR:
+                    if event.mask & (
+                        Inotify.IN_CREATE | Inotify.IN_MOVED_TO
+                    ) and not Library.pruned(event.name):
+                        for directory in watch_tree(path):
+                            for entry in directory.files:
+                                pending[video_path_for(entry.path)] = due
+                elif event.mask & (Inotify.IN_CLOSE_WRITE | Inotify.IN_MOVED_TO):
+                    pending[video_path_for(path)] = due
+
+
+def import_json(
+    dir: str,
+    dry_run: bool = False,
+    verbose: bool = False,
+    jobs: int = 8,
+    max_per_host: int = 2,
+    batch_size: int = 1000,
+    resume: bool = True,
+    probe_ttl: float = 86400.0,
+    probe_each: bool = False,
+    bulk_load: str | None = None,
+    watch: bool = False,
+    debounce: float = 2.0,
+    export_file: str | None = None,
+    export_format: str = "sql",
+    load_file: str | None = None,
+    prober: Probe.Prober | None = None,
+) -> None:
+    if load_file is not None and not resume:
+        raise ValueError("An export cannot be loaded into a fresh import")
+    if export_file is not None and watch:
+        raise ValueError("An export cannot be written while watching")
+    with (
+        Library.connect(dir) as conn,
+        (
+            Probe.Prober(max_per_host)
+            if prober is None
+            else contextlib.nullcontext(prober)
+        ) as prober,
+        (
+            Export(export_file, export_format)
+            if export_file is not None
+            else contextlib.nullcontext()
+        ) as export,
+    ):
+        dry_run = dry_run or export is not None
+        if watch:
+            if load_file is not None and not dry_run:
+                load_export(conn, load_file, export_format)
+            watch_library(
+                dir,
+                conn=conn,
+                prober=prober,
+                dry_run=dry_run,
+                verbose=verbose,
+                jobs=jobs,
+                batch_size=batch_size,
+                resume=resume,
+                probe_ttl=probe_ttl,
+                probe_each=probe_each,
+                bulk_load=bulk_load,
+                debounce=debounce,
+                export=export,
+            )
+            return
+        with (
+            Library.bulk_load(conn, bulk_load)
+            if bulk_load is not None and not dry_run
+            else contextlib.nullcontext()
+        ):
+            if load_file is not None and not dry_run:
+                load_export(conn, load_file, export_format)
+            import_library(
+                dir,
+                conn=conn,
+                prober=prober,
+                dry_run=dry_run,
+                verbose=verbose,
+                jobs=jobs,
+                batch_size=batch_size,
+                resume=resume,
+                probe_ttl=probe_ttl,
+                probe_each=probe_each,
+                export=export,
+            )
+
+
+def import_libraries(
+    dirs: list[str],
+    dry_run: bool = False,
+    verbose: bool = False,
+    jobs: int = 8,
+    max_per_host: int = 2,
+    batch_size: int = 1000,
+    resume: bool = True,
+    probe_ttl: float = 86400.0,
+    probe_each: bool = False,
+    bulk_load: str | None = None,
+    watch: bool = False,
+    debounce: float = 2.0,
+) -> None:
+    if len({os.path.realpath(dir) for dir in dirs}) != len(dirs):
+        raise ValueError("Each library can only be imported once")
+    with (
+        Probe.Prober(max_per_host) as prober,
+        concurrent.futures.ThreadPoolExecutor(len(dirs)) as executor,
+    ):
+        for future in [
+            executor.submit(
+                import_json,
+                dir,
+                dry_run=dry_run,
+                verbose=verbose,
+                jobs=jobs,
+                max_per_host=max_per_host,
+                batch_size=batch_size,
+                resume=resume,
+                probe_ttl=probe_ttl,
+                probe_each=probe_each,
+                bulk_load=bulk_load,
+                watch=watch,
+                debounce=debounce,
+                prober=prober,
+            )
+            for dir in dirs
+        ]:
+            future.result()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Import JSON files to the SQLite database"
     )
-    parser.add_argument("dir", help="root directory of library")
+    parser.add_argument(
+        "dirs",
+        nargs="+",
+        help="root directory of library; several libraries are imported"
+        " concurrently and share the connections and limits to each tuner",
+        metavar="dir",
+    )
     parser.add_argument(
         "-n", action="store_true", help="only print what would be done", dest="dry_run"
     )
@@ -368,5 +1276,127 @@ if __name__ == "__main__":
         help="print each filename while processing",
         dest="verbose",
     )
+    parser.add_argument(
+        "-j",
+        type=int,
+        default=8,
+        help="number of recordings to parse and probe concurrently",
+        dest="jobs",
+    )
+    parser.add_argument(
+        "--max-per-host",
+        type=int,
+        default=2,
+        help="maximum number of concurrent requests to each tuner",
+        dest="max_per_host",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="number of recordings to write in each transaction",
+        dest="batch_size",
+    )
+    parser.add_argument(
+        "--fresh",
+        action="store_false",
+        help="ignore progress saved by an interrupted import",
+        dest="resume",
+    )
+    parser.add_argument(
+        "--probe-ttl",
+        type=float,
+        default=86400.0,
+        help="seconds to reuse saved probe results for, or 0 to probe every URL",
+        dest="probe_ttl",
+    )
+    parser.add_argument(
+        "--probe-each",
+        action="store_true",
+        help="probe each PlayURL instead of fetching each series' episode list",
+        dest="probe_each",
+    )
+    parser.add_argument(
+        "--bulk-load",
+        choices=Library.BULK_JOURNAL_MODES,
+        help="load with this journal mode, relaxed syncing and deferred indexes;"
+        " only safe while nothing else uses the library",
+        dest="bulk_load",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep running and import new recordings as their JSON files appear"
+        " (Linux only)",
+        dest="watch",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=2.0,
+        help="seconds to wait after the last change to a recording before importing",
+        dest="debounce",
+    )
+    parser.add_argument(
+        "--export",
+        help="do a dry run that writes the rows to a file instead of printing them",
+        dest="export_file",
+    )
+    parser.add_argument(
+        "--format",
+        choices=EXPORT_FORMATS,
+        default="sql",
+        help="format of --export and --load files: a SQL script in one transaction,"
+        " or one JSON row per line",
+        dest="export_format",
+    )
+    parser.add_argument(
+        "--load",
+        help="load rows from an --export file before importing;"
+        " its JSON files are then moved to the recycle bin without re-parsing",
+        dest="load_file",
+    )
+    Stats.add_arguments(parser)
     parsed = parser.parse_args()
-    import_json(parsed.dir, parsed.dry_run, parsed.verbose)
+    if len(parsed.dirs) > 1 and (
+        parsed.export_file is not None or parsed.load_file is not None
+    ):
+        parser.error("--export and --load only work with a single library")
+    if parsed.load_file is not None and not parsed.resume:
+        parser.error("--load cannot be combined with --fresh")
+    if parsed.export_file is not None and parsed.watch:
+        parser.error("--export cannot be combined with --watch")
+    with Stats.collect(parsed.stats, parsed.profile):
+        if len(parsed.dirs) > 1:
+            import_libraries(
+                parsed.dirs,
+                dry_run=parsed.dry_run,
+                verbose=parsed.verbose,
+                jobs=parsed.jobs,
+                max_per_host=parsed.max_per_host,
+                batch_size=parsed.batch_size,
+                resume=parsed.resume,
+                probe_ttl=parsed.probe_ttl,
+                probe_each=parsed.probe_each,
+                bulk_load=parsed.bulk_load,
+                watch=parsed.watch,
+                debounce=parsed.debounce,
+            )
+        else:
+            import_json(
+                parsed.dirs[0],
+                dry_run=parsed.dry_run,
+                verbose=parsed.verbose,
+                jobs=parsed.jobs,
+                max_per_host=parsed.max_per_host,
+                batch_size=parsed.batch_size,
+                resume=parsed.resume,
+                probe_ttl=parsed.probe_ttl,
+                probe_each=parsed.probe_each,
+                bulk_load=parsed.bulk_load,
+                watch=parsed.watch,
+                debounce=parsed.debounce,
+                export_file=parsed.export_file,
+                export_format=parsed.export_format,
+                load_file=parsed.load_file,
+            )
@@ -0,0 +1,103 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import typing
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+EVENT_HEADER = struct.Struct("iIII")
+READ_SIZE = 65536
+
+
+class Event(typing.NamedTuple):
+    wd: int
+    mask: int
+    cookie: int
+    name: str
+    path: str | None
+
+
+def _libc() -> ctypes.CDLL:
+    name = ctypes.util.find_library("c")
+    if name is None:
+        raise OSError(errno.ENOSYS, "inotify is not available without a C library")
+    libc = ctypes.CDLL(name, use_errno=True)
+    if not hasattr(libc, "inotify_init1"):
+        raise OSError(errno.ENOSYS, "inotify is not available on this platform")
+    libc.inotify_init1.argtypes = (ctypes.c_int,)
+    libc.inotify_init1.restype = ctypes.c_int
+    libc.inotify_add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+    libc.inotify_add_watch.restype = ctypes.c_int
+    libc.inotify_rm_watch.argtypes = (ctypes.c_int, ctypes.c_int)
+    libc.inotify_rm_watch.restype = ctypes.c_int
+    return libc
+
+
+class Inotify:
+    def __init__(self) -> None:
+        self._lib = _libc()
+        self.fd: int = self._lib.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        self.watches: dict[int, str] = {}
+
+    def __enter__(self) -> "Inotify":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+        self.watches.clear()
+
+    def add(self, path: str, mask: int) -> int:
+        wd: int = self._lib.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e), path)
+        self.watches[wd] = path
+        return wd
+
+    def remove(self, wd: int) -> None:
+        if self.watches.pop(wd, None) is not None:
+            self._lib.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout: float | None = None) -> list[Event]:
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if len(readable) == 0:
+            return []
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+        events: list[Event] = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            events.append(Event(wd, mask, cookie, name, self.watches.get(wd)))
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+        return events
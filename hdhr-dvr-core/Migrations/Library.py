@@ -0,0 +1,327 @@
+import contextlib
+import enum
+import os
+import sqlite3
+import typing
+import urllib.parse
+
+import Stats
+
+DB_FILENAME = "Com.ZachDeibert.MediaTools.Hdhr.Dvr.Jellyfin.db"
+RECYCLE_BIN = ".recycle-bin"
+BULK_JOURNAL_MODES = ("wal", "memory")
+BULK_CACHE_KIB = 262144
+PRUNED_DIRNAMES = frozenset(
+    (
+        RECYCLE_BIN,
+        "#recycle",
+        "#snapshot",
+        "$RECYCLE.BIN",
+        ".AppleDouble",
+        ".snapshot",
+        ".snapshots",
+        "@eaDir",
+        "System Volume Information",
+        "lost+found",
+    )
+)
+SEASON_PREFIX = "Season "
+
+
+class DeleteReason(enum.IntEnum):
+    NotDeleted = 0
+    ReDownloaded = 1
+    Downloaded = 2
+    OneDayPassed = 3
+    OneWeekPassed = 4
+    Deleted = 5
+    RemoteDeleted = 6
+
+
+class DownloadReason(enum.IntEnum):
+    New = 0
+    DownloadInterrupted = 1
+
+
+class RecordingCategory(enum.IntEnum):
+    Movie = 0
+    Series = 1
+
+
+class Directory(typing.NamedTuple):
+    path: str
+    relpath: str
+    files: list[os.DirEntry[str]]
+    subdirs: list[str]
+
+
+class Recording(typing.NamedTuple):
+    series_name: str
+    series_id: str
+    series_num: int | None
+    episode_num_encoded: str | None
+    tag: str
+    file_ext: str
+
+
+class LibraryPath(typing.NamedTuple):
+    series_title: str
+    series_id: str
+    season_num: str | None
+    file_title: str
+    file_season_num: str | None
+    episode_num: str | None
+    tag: str
+    file_ext: str
+
+
+def connect(dir: str, read_only: bool = False) -> sqlite3.Connection:
+    if read_only:
+        return sqlite3.connect(
+            f"file:{urllib.parse.quote(os.path.join(dir, DB_FILENAME))}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+        )
+    return sqlite3.connect(os.path.join(dir, DB_FILENAME))
+
+
+@contextlib.contextmanager
+def bulk_load(
+    conn: sqlite3.Connection, journal_mode: str = "wal"
+) -> typing.Iterator[None]:
+    if journal_mode not in BULK_JOURNAL_MODES:
+        raise ValueError(f"Unsupported journal mode {journal_mode}")
+    original_journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+    cache_size = conn.execute("PRAGMA cache_size").fetchone()[0]
+    indexes: list[tuple[str, str]] = list(
+        conn.execute(
+            "SELECT `name`, `sql` FROM `sqlite_master`"
+            " WHERE `type` = 'index' AND `sql` IS NOT NULL"
+            " AND `tbl_name` IN ('Series', 'Episodes')"
+        )
+    )
+    conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+    conn.execute(f"PRAGMA synchronous = {'NORMAL' if journal_mode == 'wal' else 'OFF'}")
+    conn.execute(f"PRAGMA cache_size = -{BULK_CACHE_KIB}")
+    with conn:
+        for name, _ in indexes:
+            conn.execute(f"DROP INDEX `{name}`")
+    try:
+        yield
+    finally:
+        with conn:
+            for _, sql in indexes:
+                conn.execute(sql)
+        conn.execute(f"PRAGMA journal_mode = {original_journal_mode}")
+        conn.execute(f"PRAGMA synchronous = {synchronous}")
+        conn.execute(f"PRAGMA cache_size = {cache_size}")
+    conn.execute("ANALYZE")
+    conn.commit()
+    problems = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    if problems != ["ok"]:
+        raise sqlite3.DatabaseError(f"Integrity check failed: {'; '.join(problems)}")
+
+
+def is_number(value: str) -> bool:
+    return value != "" and value.isascii() and value.isdigit()
+
+
+def number_end(value: str, start: int) -> int:
+    end = start
+    while end < len(value) and "0" <= value[end] <= "9":
+        end += 1
+    return end
+
+
+def split_suffix(name: str, separator: str, close: str) -> tuple[str, str] | None:
+    if not name.endswith(close):
+        return None
+    i = name.rfind(separator, 0, len(name) - 1)
+    while i >= 1:
+        suffix = name[i + len(separator) : -1]
+        if close in suffix:
+            return None
+        if suffix != "":
+            return name[:i], suffix
+        i = name.rfind(separator, 0, i)
+    return None
+
+
+def split_episode_number(title: str) -> tuple[str, str | None, str | None]:
+    i = title.rfind(" S")
+    while i >= 1:
+        season_end = number_end(title, i + 2)
+        if season_end > i + 2 and title.startswith("E", season_end):
+            episode_end = number_end(title, season_end + 1)
+            if episode_end > season_end + 1:
+                return (
+                    title[:i],
+                    title[i + 2 : season_end],
+                    title[season_end + 1 : episode_end],
+                )
+        i = title.rfind(" S", 0, i)
+    return title, None, None
+
+
+def episode_token_season(token: str) -> str | None:
+    if not token.startswith("S"):
+        return None
+    season, _, episode = token[1:].partition("E")
+    if not is_number(season) or not is_number(episode):
+        return None
+    return season
+
+
+def parse_series_dirname(series_dirname: str) -> tuple[str, str] | None:
+    return split_suffix(series_dirname, " (", ")")
+
+
+def parse_recording(series_dirname: str, video_filename: str) -> Recording | None:
+    series = parse_series_dirname(series_dirname)
+    if series is None:
+        return None
+    stem, dot, ext = video_filename.rpartition(".")
+    if dot == "" or ext == "" or not stem.endswith("]"):
+        return None
+    floor = max(0, stem.rfind("]", 0, len(stem) - 1))
+    candidates: list[int] = []
+    i = stem.rfind(" [", floor, len(stem) - 2)
+    while i >= 0:
+        candidates.append(i + 1)
+        i = stem.rfind(" [", floor, i + 1)
+    for i in candidates:
+        head, _, token = stem[: i - 1].rpartition(" ")
+        if is_number(token):
+            head, _, token = head.rpartition(" ")
+        season = episode_token_season(token)
+        if head != "" and season is not None:
+            return Recording(
+                series_name=series[0],
+                series_id=series[1],
+                series_num=int(season),
+                episode_num_encoded=token,
+                tag=stem[i:],
+                file_ext=f".{ext}",
+            )
+    for i in candidates:
+        head, _, token = stem[: i - 1].rpartition(" ")
+        if head != "" and is_number(token):
+            return Recording(
+                series_name=series[0],
+                series_id=series[1],
+                series_num=None,
+                episode_num_encoded=None,
+                tag=stem[i:],
+                file_ext=f".{ext}",
+            )
+    return None
+
+
+def target_dir(recording: Recording) -> str:
+    return os.path.join(
+        *(
+            x
+            for x in (
+                f"{recording.series_name} [{recording.series_id}]",
+                (
+                    f"Season {recording.series_num:02d}"
+                    if recording.series_num is not None
+                    else None
+                ),
+            )
+            if x is not None
+        )
+    )
+
+
+def target_name(recording: Recording) -> str:
+    return f"{recording.series_name}{' ' + recording.episode_num_encoded if recording.episode_num_encoded is not None else ''} - {recording.tag}{recording.file_ext}"
+
+
+def parse_parts(parts: typing.Sequence[str]) -> LibraryPath | None:
+    if len(parts) < 2:
+        return None
+    series_index = len(parts) - 2
+    season_num = None
+    if parts[-2].startswith(SEASON_PREFIX) and is_number(
+        parts[-2][len(SEASON_PREFIX) :]
+    ):
+        season_num = parts[-2][len(SEASON_PREFIX) :]
+        series_index -= 1
+    if series_index < 0:
+        return None
+    series = split_suffix(parts[series_index], " [", "]")
+    if series is None:
+        return None
+    stem, dot, ext = parts[-1].rpartition(".")
+    if dot == "" or ext == "":
+        return None
+    file = split_suffix(stem, " - [", "]")
+    if file is None:
+        return None
+    file_title, file_season_num, episode_num = split_episode_number(file[0])
+    return LibraryPath(
+        series_title=series[0],
+        series_id=series[1],
+        season_num=season_num,
+        file_title=file_title,
+        file_season_num=file_season_num,
+        episode_num=episode_num,
+        tag=file[1],
+        file_ext=f".{ext}",
+    )
+
+
+def parse_relpath(relpath: str) -> LibraryPath | None:
+    return parse_parts(relpath.replace("\\", "/").rsplit("/", 2))
+
+
+def parse_path(video_path: str) -> LibraryPath | None:
+    return parse_parts(video_path.replace("\\", "/").rsplit("/", 3)[1:])
+
+
+def pruned(name: str) -> bool:
+    return name in PRUNED_DIRNAMES or name.startswith(".Trash")
+
+
+def walk(
+    root: str,
+    prune: typing.Callable[[str], bool] = pruned,
+    max_depth: int | None = None,
+) -> typing.Iterator[Directory]:
+    stack = [(root, ".", 0)]
+    while len(stack) > 0:
+        path, relpath, depth = stack.pop()
+        files: list[os.DirEntry[str]] = []
+        subdirs: list[str] = []
+        descend: list[tuple[str, str, int]] = []
+        try:
+            with Stats.phase("walk"), os.scandir(path) as it:
+                for entry in it:
+                    if not entry.is_dir():
+                        files.append(entry)
+                        continue
+                    subdirs.append(entry.name)
+                    if (
+                        not entry.is_symlink()
+                        and not prune(entry.name)
+                        and (max_depth is None or depth < max_depth)
+                    ):
+                        descend.append(
+                            (
+                                entry.path,
+                                (
+                                    entry.name
+                                    if relpath == "."
+                                    else os.path.join(relpath, entry.name)
+                                ),
+                                depth + 1,
+                            )
+                        )
+        except OSError:
+            continue
+        Stats.count("directories")
+        Stats.count("files seen", len(files))
+        yield Directory(path, relpath, files, subdirs)
+        stack.extend(reversed(descend))
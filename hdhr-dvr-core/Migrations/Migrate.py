@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+import argparse
+import contextlib
+import os
+import sys
+
+import ImportJson
+import Library
+import Probe
+import RenameFolders
+import Scrub
+import Stats
+
+
+def migrate(
+    dir: str,
+    dry_run: bool = False,
+    verbose: bool = False,
+    jobs: int = 8,
+    max_per_host: int = 2,
+    batch_size: int = 1000,
+    resume: bool = True,
+    reverse: bool = False,
+    emit_updates: str | None = None,
+    probe_ttl: float = 86400.0,
+    probe_each: bool = False,
+    bulk_load: str | None = None,
+) -> bool:
+    with (
+        Library.connect(dir) as conn,
+        Probe.Prober(max_per_host) as prober,
+    ):
+        directories = list(Library.walk(dir))
+        with (
+            Library.bulk_load(conn, bulk_load)
+            if bulk_load is not None and not dry_run
+            else contextlib.nullcontext()
+        ):
+            consumed = ImportJson.import_library(
+                dir,
+                conn=conn,
+                prober=prober,
+                directories=directories,
+                dry_run=dry_run,
+                verbose=verbose,
+                jobs=jobs,
+                batch_size=batch_size,
+                resume=resume,
+                probe_ttl=probe_ttl,
+                probe_each=probe_each,
+            )
+        directories = [
+            d._replace(files=[e for e in d.files if e.path not in consumed])
+            for d in directories
+        ]
+        with Stats.phase("plan"):
+            plan = RenameFolders.plan(dir, directories)
+        for collision in plan.collisions:
+            print(f"Target already exists: {os.path.join(dir, collision)}")
+        if dry_run:
+            RenameFolders.print_plan(dir, plan)
+            return len(plan.collisions) == 0
+        moved: dict[tuple[str, str], str] = {}
+        if len(plan.collisions) == 0:
+            RenameFolders.apply_plan(dir, plan, verbose, jobs)
+            moved = {
+                (move.series_dir, move.filename): os.path.join(
+                    dir, move.target_dir, move.target_name
+                )
+                for move in plan.moves
+            }
+        with Stats.phase("load"):
+            entries = Scrub.load_entries(conn)
+        matches: dict[int, list[str]] = {}
+        Stats.expect("files", sum(len(d.files) for d in directories))
+        for directory in directories:
+            if directory.relpath == ".":
+                continue
+            for entry in directory.files:
+                video_path = moved.get((directory.relpath, entry.name), entry.path)
+                with Stats.phase("check"):
+                    verdict = Scrub.check_file(video_path, entries)
+                if len(verdict.messages) > 0:
+                    Stats.count("mismatches")
+                Stats.progress()
+                Scrub.report(verdict, verbose, reverse)
+                for id in verdict.matches:
+                    matches.setdefault(id, []).append(video_path)
+        if reverse:
+            Scrub.reconcile(entries, matches, emit_updates)
+        return len(plan.collisions) == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Import, rename and scrub a library in a single pass"
+    )
+    parser.add_argument("dir", help="root directory of library")
+    parser.add_argument(
+        "-n", action="store_true", help="only print what would be done", dest="dry_run"
+    )
+    parser.add_argument(
+        "-v",
+        action="store_true",
+        help="print each filename while processing",
+        dest="verbose",
+    )
+    parser.add_argument(
+        "-j",
+        type=int,
+        default=8,
+        help="number of recordings or folders to process concurrently",
+        dest="jobs",
+    )
+    parser.add_argument(
+        "--max-per-host",
+        type=int,
+        default=2,
+        help="maximum number of concurrent requests to each tuner",
+        dest="max_per_host",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="number of recordings to write in each transaction",
+        dest="batch_size",
+    )
+    parser.add_argument(
+        "--fresh",
+        action="store_false",
+        help="ignore progress saved by an interrupted import",
+        dest="resume",
+    )
+    parser.add_argument(
+        "--reverse",
+        action="store_true",
+        help="also report database entries whose files are missing",
+        dest="reverse",
+    )
+    parser.add_argument(
+        "--emit-updates",
+        help="write the SQL to mark entries with missing files as deleted to a file",
+        metavar="FILE",
+        dest="emit_updates",
+    )
+    parser.add_argument(
+        "--probe-ttl",
+        type=float,
+        default=86400.0,
+        help="seconds to reuse saved probe results for, or 0 to probe every URL",
+        dest="probe_ttl",
+    )
+    parser.add_argument(
+        "--probe-each",
+        action="store_true",
+        help="probe each PlayURL instead of fetching each series' episode list",
+        dest="probe_each",
+    )
+    parser.add_argument(
+        "--bulk-load",
+        choices=Library.BULK_JOURNAL_MODES,
+        help="import with this journal mode, relaxed syncing and deferred indexes;"
+        " only safe while nothing else uses the library",
+        dest="bulk_load",
+    )
+    Stats.add_arguments(parser)
+    parsed = parser.parse_args()
+    with Stats.collect(parsed.stats, parsed.profile):
+        succeeded = migrate(
+            parsed.dir,
+            parsed.dry_run,
+            parsed.verbose,
+            parsed.jobs,
+            parsed.max_per_host,
+            parsed.batch_size,
+            parsed.resume,
+            parsed.reverse or parsed.emit_updates is not None,
+            parsed.emit_updates,
+            parsed.probe_ttl,
+            parsed.probe_each,
+            parsed.bulk_load,
+        )
+    if not succeeded:
+        sys.exit(1)
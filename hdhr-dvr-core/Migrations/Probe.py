@@ -0,0 +1,161 @@
+import http.client
+import queue
+import random
+import threading
+import time
+import urllib.parse
+
+import Stats
+
+
+class _Host:
+    def __init__(self, max_connections: int) -> None:
+        self.slots = threading.BoundedSemaphore(max_connections)
+        self.idle: queue.LifoQueue[http.client.HTTPConnection] = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.backoff = 0.0
+        self.resume = 0.0
+        self.head = True
+
+
+class Prober:
+    def __init__(
+        self,
+        max_per_host: int = 2,
+        timeout: float = 30.0,
+        min_backoff: float = 0.25,
+        max_backoff: float = 30.0,
+    ) -> None:
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self._hosts: dict[tuple[str, str], _Host] = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "Prober":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            hosts = list(self._hosts.values())
+        for host in hosts:
+            while True:
+                try:
+                    host.idle.get_nowait().close()
+                except queue.Empty:
+                    break
+
+    def probe(self, url: str) -> int:
+        Stats.count("probes")
+        return self._request(url, False)[0]
+
+    def fetch(self, url: str) -> tuple[int, bytes]:
+        Stats.count("fetches")
+        return self._request(url, True)
+
+    def _request(self, url: str, body: bool) -> tuple[int, bytes]:
+        parts = urllib.parse.urlsplit(url)
+        host = self._host(parts.scheme, parts.netloc)
+        while True:
+            with host.slots:
+                self._wait(host)
+                with Stats.phase("fetch" if body else "probe"):
+                    if body:
+                        status, data = self._send(host, parts, "GET", {}, True)
+                    else:
+                        if host.head:
+                            status, data = self._send(host, parts, "HEAD", {})
+                            if status in (405, 501):
+                                host.head = False
+                        if not host.head:
+                            status, data = self._send(
+                                host, parts, "GET", {"Range": "bytes=0-0"}
+                            )
+            if status != 503:
+                self._succeeded(host)
+                return status, data
+            self._throttled(host)
+
+    def _host(self, scheme: str, netloc: str) -> _Host:
+        with self._lock:
+            host = self._hosts.get((scheme, netloc))
+            if host is None:
+                host = _Host(self.max_per_host)
+                self._hosts[(scheme, netloc)] = host
+            return host
+
+    def _wait(self, host: _Host) -> None:
+        with host.lock:
+            delay = host.resume - time.monotonic()
+        if delay > 0:
+            with Stats.phase("backoff"):
+                time.sleep(delay)
+
+    def _succeeded(self, host: _Host) -> None:
+        with host.lock:
+            host.backoff /= 2
+            if host.backoff < self.min_backoff:
+                host.backoff = 0.0
+
+    def _throttled(self, host: _Host) -> None:
+        Stats.count("retries")
+        with host.lock:
+            host.backoff = min(
+                self.max_backoff, max(self.min_backoff, host.backoff * 2)
+            )
+            host.resume = max(
+                host.resume,
+                time.monotonic() + host.backoff * random.uniform(0.5, 1.0),
+            )
+
+    def _connect(self, parts: urllib.parse.SplitResult) -> http.client.HTTPConnection:
+        match parts.scheme:
+            case "http":
+                return http.client.HTTPConnection(parts.netloc, timeout=self.timeout)
+            case "https":
+                return http.client.HTTPSConnection(parts.netloc, timeout=self.timeout)
+            case _:
+                raise ValueError(f"Unsupported URL scheme {parts.scheme}")
+
+    def _send(
+        self,
+        host: _Host,
+        parts: urllib.parse.SplitResult,
+        method: str,
+        headers: dict[str, str],
+        body: bool = False,
+    ) -> tuple[int, bytes]:
+        path = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+        while True:
+            try:
+                conn = host.idle.get_nowait()
+                reused = True
+            except queue.Empty:
+                conn = self._connect(parts)
+                reused = False
+            try:
+                conn.request(method, path, headers=headers)
+                response = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionError):
+                conn.close()
+                if reused:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+            data = b""
+            if method == "GET" and response.status == 200 and not body:
+                # The server ignored the Range header, so the body is the whole stream
+                conn.close()
+            else:
+                data = response.read()
+                if response.will_close:
+                    conn.close()
+                else:
+                    host.idle.put(conn)
+            return response.status, data
@@ -1,63 +1,252 @@
 #!/usr/bin/env python
 import argparse
+import concurrent.futures
+import errno
+import json
 import os
-import re
+import sys
+import typing
 
-SERIES_DIRNAME_RE = re.compile("^(.+) [(]([^)]+)[)]$")
-EPISODE_FILENAME_RE = re.compile(
-    "^.+ (S([0-9]+)E[0-9]+) (?:[0-9]+ )?(\\[[^\\]]+\\])([.][^.]+)$"
-)
-MOVIE_FILENAME_RE = re.compile("^.+ [0-9]+ (\\[[^\\]]+\\])([.][^.]+)$")
+import Library
+import Stats
 
+DIR_FLAGS = os.O_RDONLY | getattr(os, "O_DIRECTORY", 0)
+FD_RESERVE = 64
 
-def rename_folders(dir: str, dry_run: bool = False, verbose: bool = False) -> None:
-    for series_dirname in os.listdir(dir):
-        series_dir = os.path.join(dir, series_dirname)
-        series_match = SERIES_DIRNAME_RE.match(series_dirname)
-        if series_match is None or not os.path.isdir(series_dir):
+
+class Move(typing.NamedTuple):
+    series_dir: str
+    filename: str
+    target_dir: str
+    target_name: str
+
+
+class Plan(typing.NamedTuple):
+    moves: list[Move]
+    mkdirs: list[str]
+    rmdirs: list[str]
+    collisions: list[str]
+
+
+def plan(
+    dir: str, directories: typing.Iterable[Library.Directory] | None = None
+) -> Plan:
+    listing = {
+        d.relpath: d
+        for d in (
+            directories if directories is not None else Library.walk(dir, max_depth=2)
+        )
+    }
+    moves: list[Move] = []
+    rmdirs: list[str] = []
+    for series_dirname in sorted(listing["."].subdirs):
+        if Library.parse_series_dirname(series_dirname) is None:
             continue
-        series_name = series_match.group(1)
-        series_id = series_match.group(2)
-        target_series_dir = os.path.join(dir, f"{series_name} [{series_id}]")
-        for video_filename in os.listdir(series_dir):
-            video_file = os.path.join(series_dir, video_filename)
-            episode_match = EPISODE_FILENAME_RE.match(video_filename)
-            if episode_match is not None:
-                episode_num_encoded = episode_match.group(1)
-                series_num = int(episode_match.group(2))
-                tag = episode_match.group(3)
-                file_ext = episode_match.group(4)
-            else:
-                movie_match = MOVIE_FILENAME_RE.match(video_filename)
-                if movie_match is None:
-                    continue
-                episode_num_encoded = None
-                series_num = None
-                tag = movie_match.group(1)
-                file_ext = movie_match.group(2)
-            if file_ext not in (".mpg",):
+        series_dir = listing.get(series_dirname)
+        if series_dir is None:
+            continue
+        video_filenames = sorted(e.name for e in series_dir.files)
+        moved = 0
+        for video_filename in video_filenames:
+            recording = Library.parse_recording(series_dirname, video_filename)
+            if recording is None or recording.file_ext not in (".mpg",):
                 continue
-            target_file = os.path.join(
-                *(
-                    x
-                    for x in (
-                        target_series_dir,
-                        f"Season {series_num:02d}" if series_num is not None else None,
-                        f"{series_name}{' ' + episode_num_encoded if episode_num_encoded is not None else ''} - {tag}{file_ext}",
-                    )
-                    if x is not None
+            moves.append(
+                Move(
+                    series_dir=series_dirname,
+                    filename=video_filename,
+                    target_dir=Library.target_dir(recording),
+                    target_name=Library.target_name(recording),
                 )
             )
-            if verbose:
-                print(f"mv {video_file} {target_file}")
-            if not dry_run:
-                os.makedirs(os.path.dirname(target_file), exist_ok=True)
-                os.rename(video_file, target_file)
-        if len(os.listdir(series_dir)) == 0:
-            if verbose:
-                print(f"rmdir {series_dir}")
-            if not dry_run:
-                os.rmdir(series_dir)
+            moved += 1
+        if moved == len(video_filenames) and len(series_dir.subdirs) == 0:
+            rmdirs.append(series_dirname)
+    mkdirs: list[str] = []
+    existing: dict[str, set[str]] = {}
+    for move in moves:
+        if move.target_dir in existing:
+            continue
+        target = listing.get(move.target_dir)
+        if target is not None:
+            existing[move.target_dir] = {e.name for e in target.files} | set(
+                target.subdirs
+            )
+        else:
+            existing[move.target_dir] = set()
+            parent = os.path.dirname(move.target_dir)
+            if parent != "" and parent not in mkdirs and parent not in listing:
+                mkdirs.append(parent)
+            mkdirs.append(move.target_dir)
+    collisions: list[str] = []
+    for move in moves:
+        if move.target_name in existing[move.target_dir]:
+            collisions.append(os.path.join(move.target_dir, move.target_name))
+        existing[move.target_dir].add(move.target_name)
+    return Plan(moves, mkdirs, rmdirs, collisions)
+
+
+def save_plan(plan: Plan, path: str) -> None:
+    with open(path, "w") as f:
+        json.dump(plan._asdict(), f, indent=4)
+
+
+def load_plan(path: str) -> Plan:
+    with open(path, "r") as f:
+        plan = json.load(f)
+    return Plan(
+        moves=[Move(*m) for m in plan["moves"]],
+        mkdirs=plan["mkdirs"],
+        rmdirs=plan["rmdirs"],
+        collisions=plan["collisions"],
+    )
+
+
+def group_moves(plan: Plan) -> dict[str, list[Move]]:
+    groups: dict[str, list[Move]] = {}
+    for move in plan.moves:
+        groups.setdefault(move.series_dir, []).append(move)
+    for series_dir in plan.rmdirs:
+        groups.setdefault(series_dir, [])
+    return groups
+
+
+def print_plan(dir: str, plan: Plan) -> None:
+    rmdirs = set(plan.rmdirs)
+    for series_dir, moves in group_moves(plan).items():
+        for move in moves:
+            print(
+                f"mv {os.path.join(dir, move.series_dir, move.filename)}"
+                f" {os.path.join(dir, move.target_dir, move.target_name)}"
+            )
+        if series_dir in rmdirs:
+            print(f"rmdir {os.path.join(dir, series_dir)}")
+
+
+def fd_limit() -> int | None:
+    try:
+        import resource
+    except ImportError:
+        return None
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    return None if soft == resource.RLIM_INFINITY else soft
+
+
+def apply_plan(dir: str, plan: Plan, verbose: bool = False, jobs: int = 8) -> None:
+    groups = group_moves(plan)
+    existing: dict[str, set[str]] = {}
+    for relpath in {move.target_dir for move in plan.moves}:
+        try:
+            existing[relpath] = set(os.listdir(os.path.join(dir, relpath)))
+        except FileNotFoundError:
+            existing[relpath] = set()
+    for move in plan.moves:
+        if move.target_name in existing[move.target_dir]:
+            raise FileExistsError(os.path.join(dir, move.target_dir, move.target_name))
+        existing[move.target_dir].add(move.target_name)
+    use_fds = os.rename in os.supports_dir_fd
+    limit = fd_limit() if use_fds else None
+    if limit is not None:
+        per_group = 1 + max(
+            (len({move.target_dir for move in moves}) for moves in groups.values()),
+            default=0,
+        )
+        available = limit - FD_RESERVE
+        if available < per_group:
+            raise OSError(
+                errno.EMFILE,
+                f"Moving a series needs {per_group} open directories,"
+                f" but only {max(0, available)} more files can be opened",
+            )
+        jobs = max(1, min(jobs, available // per_group))
+    root_fd = os.open(dir, DIR_FLAGS) if use_fds else None
+
+    def path(fd: int | None, relpath: str, name: str) -> str:
+        return name if fd is not None else os.path.join(dir, relpath, name)
+
+    try:
+        for mkdir in plan.mkdirs:
+            try:
+                if root_fd is None:
+                    os.mkdir(os.path.join(dir, mkdir))
+                else:
+                    os.mkdir(mkdir, dir_fd=root_fd)
+            except FileExistsError:
+                pass
+        rmdirs = set(plan.rmdirs)
+        Stats.expect("renames", len(plan.moves))
+
+        def apply_group(series_dir: str, moves: list[Move]) -> None:
+            fds: dict[str, int | None] = {}
+
+            def open_dir(relpath: str) -> int | None:
+                if root_fd is None:
+                    return None
+                if relpath not in fds:
+                    fds[relpath] = os.open(relpath, DIR_FLAGS, dir_fd=root_fd)
+                return fds[relpath]
+
+            try:
+                for move in moves:
+                    src_fd = open_dir(series_dir)
+                    dst_fd = open_dir(move.target_dir)
+                    if verbose:
+                        print(
+                            f"mv {os.path.join(dir, move.series_dir, move.filename)}"
+                            f" {os.path.join(dir, move.target_dir, move.target_name)}"
+                        )
+                    with Stats.phase("rename"):
+                        os.rename(
+                            path(src_fd, series_dir, move.filename),
+                            path(dst_fd, move.target_dir, move.target_name),
+                            src_dir_fd=src_fd,
+                            dst_dir_fd=dst_fd,
+                        )
+                    Stats.progress()
+            finally:
+                for fd in fds.values():
+                    if fd is not None:
+                        os.close(fd)
+            if series_dir in rmdirs:
+                if verbose:
+                    print(f"rmdir {os.path.join(dir, series_dir)}")
+                if root_fd is None:
+                    os.rmdir(os.path.join(dir, series_dir))
+                else:
+                    os.rmdir(series_dir, dir_fd=root_fd)
+
+        with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+            for future in [
+                executor.submit(apply_group, series_dir, moves)
+                for series_dir, moves in groups.items()
+            ]:
+                future.result()
+    finally:
+        if root_fd is not None:
+            os.close(root_fd)
+
+
+def rename_folders(
+    dir: str,
+    dry_run: bool = False,
+    verbose: bool = False,
+    plan_file: str | None = None,
+    apply_file: str | None = None,
+    jobs: int = 8,
+) -> list[str]:
+    with Stats.phase("plan"):
+        folder_plan = load_plan(apply_file) if apply_file is not None else plan(dir)
+    Stats.count("renames planned", len(folder_plan.moves))
+    Stats.count("collisions", len(folder_plan.collisions))
+    if plan_file is not None:
+        save_plan(folder_plan, plan_file)
+    for collision in folder_plan.collisions:
+        print(f"Target already exists: {os.path.join(dir, collision)}")
+    if dry_run:
+        print_plan(dir, folder_plan)
+    elif len(folder_plan.collisions) == 0:
+        apply_plan(dir, folder_plan, verbose, jobs)
+    return folder_plan.collisions
 
 
 if __name__ == "__main__":
@@ -74,5 +263,33 @@ if __name__ == "__main__":
         help="print each filename while processing",
         dest="verbose",
     )
+    parser.add_argument(
+        "--plan",
+        help="save the planned moves to a file",
+        dest="plan_file",
+    )
+    parser.add_argument(
+        "--apply",
+        help="apply the moves saved in a file instead of planning new ones",
+        dest="apply_file",
+    )
+    parser.add_argument(
+        "-j",
+        type=int,
+        default=8,
+        help="number of series folders to move concurrently",
+        dest="jobs",
+    )
+    Stats.add_arguments(parser)
     parsed = parser.parse_args()
-    rename_folders(parsed.dir, parsed.dry_run, parsed.dry_run or parsed.verbose)
+    with Stats.collect(parsed.stats, parsed.profile):
+        collisions = rename_folders(
+            parsed.dir,
+            parsed.dry_run,
+            parsed.dry_run or parsed.verbose,
+            parsed.plan_file,
+            parsed.apply_file,
+            parsed.jobs,
+        )
+    if len(collisions) > 0 and not parsed.dry_run:
+        sys.exit(1)
@@ -1,101 +1,521 @@
 #!/usr/bin/env python
 import argparse
+import concurrent.futures
+import datetime
+import hashlib
+import itertools
+import json
+import mmap
 import os
-import re
 import sqlite3
+import threading
+import typing
 
-FILENAME_RE = re.compile(
-    "^.*"
-    "[/\\\\]"
-    "([^/\\\\]+) \\[([^/\\\\\\]]+)\\]"
-    "[/\\\\]"
-    "(?:Season ([0-9]+))?"
-    "[/\\\\]?"
-    "([^/\\\\]+) - \\[([^/\\\\\\]]+)\\]([.][^./\\\\]+)$"
-)
-SERIES_EPISODE_RE = re.compile("^(.+) S([0-9]+)E([0-9]+)")
-
-
-def scrub(dir: str, verbose: bool = False) -> None:
-    with sqlite3.connect(
-        os.path.join(dir, "Com.ZachDeibert.MediaTools.Hdhr.Dvr.Jellyfin.db")
-    ) as conn:
-        for dirpath, _, filenames in os.walk(dir):
-            if dirpath == dir:
-                continue
-            for video_filename in filenames:
-                video_path = os.path.join(dirpath, video_filename)
-                match = FILENAME_RE.match(video_path)
-                if match is None:
-                    print(f"Unable to parse file path {video_path}")
-                    continue
-                series_title_1 = match.group(1)
-                series_id = match.group(2)
-                season_num_1 = match.group(3)
-                series_title_2 = match.group(4)
-                tag = match.group(5)
-                file_ext = match.group(6)
-                series_episode_match = SERIES_EPISODE_RE.match(series_title_2)
-                if series_episode_match is not None:
-                    series_title_2 = series_episode_match.group(1)
-                    season_num_2 = series_episode_match.group(2)
-                    episode_num = series_episode_match.group(3)
-                else:
-                    season_num_2 = None
-                    episode_num = None
-                res = list(
-                    conn.execute(
-                        "SELECT `Episodes`.`Id`, `Series`.`Metadata_Title`, `Episodes`.`Metadata_Filename`"
-                        " FROM `Episodes`"
-                        " INNER JOIN `Series` ON `Series`.`Id` = `Episodes`.`SeriesId`"
-                        " WHERE `Series`.`Metadata_SeriesId` = ?"
-                        f" AND `Episodes`.`Metadata_EpisodeNumber` {'ISNULL' if episode_num is None else '= ?'}",
-                        tuple(
-                            v
-                            for v in (
-                                series_id,
-                                (
-                                    f"S{season_num_2}E{episode_num}"
-                                    if episode_num is not None
-                                    else None
-                                ),
-                            )
-                            if v is not None
-                        ),
-                    )
+import Library
+import Stats
+from Library import DeleteReason
+
+TS_PACKET_SIZE = 188
+TS_SYNC = b"\x47"
+SAMPLE_PACKETS = 64
+SAMPLES = 16
+MEDIA_EXTENSIONS = (".mpg", ".ts")
+
+
+class Entry(typing.NamedTuple):
+    Id: int
+    Metadata_Title: str
+    Metadata_Filename: str
+    DeleteReason: DeleteReason
+
+
+def create_indexes(conn: sqlite3.Connection) -> None:
+    with conn:
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS `IX_Scrub_Series_Metadata_SeriesId`"
+            " ON `Series` (`Metadata_SeriesId`, `Id`, `Metadata_Title`)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS `IX_Scrub_Episodes_Metadata_EpisodeNumber`"
+            " ON `Episodes` (`SeriesId`, `Metadata_EpisodeNumber`, `Metadata_Filename`)"
+        )
+
+
+def load_entries(
+    conn: sqlite3.Connection, series_ids: typing.Collection[str] | None = None
+) -> dict[tuple[str, str | None], list[Entry]]:
+    sql = (
+        "SELECT `Series`.`Metadata_SeriesId`, `Episodes`.`Metadata_EpisodeNumber`,"
+        " `Episodes`.`Id`, `Series`.`Metadata_Title`, `Episodes`.`Metadata_Filename`,"
+        " `Episodes`.`DeleteReason`"
+        " FROM `Episodes`"
+        " INNER JOIN `Series` ON `Series`.`Id` = `Episodes`.`SeriesId`"
+    )
+    params: tuple[str, ...] = ()
+    if series_ids is not None:
+        sql += (
+            " WHERE `Series`.`Metadata_SeriesId` IN ("
+            + ", ".join("?" for _ in series_ids)
+            + ")"
+        )
+        params = tuple(series_ids)
+    entries: dict[tuple[str, str | None], list[Entry]] = {}
+    for (
+        key_series_id,
+        episode_number,
+        id,
+        title,
+        filename,
+        delete_reason,
+    ) in conn.execute(sql, params):
+        entries.setdefault((key_series_id, episode_number), []).append(
+            Entry(id, title, filename, DeleteReason(delete_reason))
+        )
+    for rows in entries.values():
+        rows.sort(key=lambda entry: entry.Id)
+    return entries
+
+
+def reconcile(
+    entries: dict[tuple[str, str | None], list[Entry]],
+    matches: dict[int, list[str]],
+    emit_updates: str | None = None,
+) -> None:
+    orphans: list[Entry] = sorted(
+        (
+            entry
+            for rows in entries.values()
+            for entry in rows
+            if entry.DeleteReason == DeleteReason.NotDeleted and entry.Id not in matches
+        ),
+        key=lambda entry: entry.Id,
+    )
+    for entry in orphans:
+        print(
+            f"Missing file for database entry {entry.Id}"
+            f" ({entry.Metadata_Title}: {entry.Metadata_Filename})"
+        )
+    for id, paths in sorted(matches.items()):
+        if len(paths) > 1:
+            print(f"Multiple files for database entry {id}")
+            for path in sorted(paths):
+                print(f"    {path}")
+    if emit_updates is not None:
+        with open(emit_updates, "w") as f:
+            f.write("BEGIN;\n")
+            for entry in orphans:
+                f.write(
+                    "UPDATE `Episodes` SET `DeleteReason` ="
+                    f" {DeleteReason.Deleted.value} WHERE `Id` = {entry.Id};\n"
                 )
-                res_title = ""
-                if len(res) > 0:
-                    res_title: str = res[0][1]
-                    for char in '<>:"/\\|?*':
-                        res_title = res_title.replace(char, "")
-                if series_title_1 != series_title_2 or (
-                    len(res) > 0 and series_title_1 != res_title
-                ):
-                    print(f"Title mismatch for {video_path}")
-                if season_num_1 != season_num_2 or (season_num_2 is None) != (
-                    episode_num is None
-                ):
-                    print(f"Season number mismatch for {video_path}")
-                if len(res) > 0:
-                    for row in res:
-                        if tag in row[2] and row[2].endswith(file_ext):
-                            break
-                    else:
-                        print(f"Filename mismatch for {video_path}")
-                match len(res):
-                    case 0:
-                        print(f"Missing database entry for {video_path}")
-                    case 1 if verbose:
-                        print(f"Exactly one entry for {video_path}")
-                    case _ if verbose:
-                        print(f"Multiple entries for {video_path}")
-                        print(
-                            "    "
-                            + " => ".join(":".join(str(v) for v in r) for r in res)
+            f.write("COMMIT;\n")
+
+
+class Verdict(typing.NamedTuple):
+    messages: list[str]
+    reverse_messages: list[str]
+    details: list[str]
+    matches: list[int]
+
+
+def lookup(
+    path: Library.LibraryPath | None,
+    entries: dict[tuple[str, str | None], list[Entry]],
+) -> list[Entry]:
+    if path is None:
+        return []
+    return entries.get(
+        (
+            path.series_id,
+            (
+                f"S{path.file_season_num}E{path.episode_num}"
+                if path.episode_num is not None
+                else None
+            ),
+        ),
+        [],
+    )
+
+
+def match_entries(path: Library.LibraryPath, res: list[Entry]) -> list[Entry]:
+    return [
+        row
+        for row in res
+        if path.tag in row.Metadata_Filename
+        and row.Metadata_Filename.endswith(path.file_ext)
+    ]
+
+
+def fingerprint(res: list[Entry]) -> str:
+    return hashlib.sha1(repr(res).encode()).hexdigest()
+
+
+def check(
+    video_path: str, path: Library.LibraryPath | None, res: list[Entry]
+) -> Verdict:
+    verdict = Verdict([], [], [], [])
+    if path is None:
+        verdict.messages.append(f"Unable to parse file path {video_path}")
+        return verdict
+    res_title = ""
+    if len(res) > 0:
+        res_title = res[0].Metadata_Title
+        for char in '<>:"/\\|?*':
+            res_title = res_title.replace(char, "")
+    if path.series_title != path.file_title or (
+        len(res) > 0 and path.series_title != res_title
+    ):
+        verdict.messages.append(f"Title mismatch for {video_path}")
+    if path.season_num != path.file_season_num or (path.file_season_num is None) != (
+        path.episode_num is None
+    ):
+        verdict.messages.append(f"Season number mismatch for {video_path}")
+    matched = match_entries(path, res)
+    if len(res) > 0 and len(matched) == 0:
+        verdict.messages.append(f"Filename mismatch for {video_path}")
+    verdict.matches.extend(row.Id for row in matched)
+    live = [row for row in matched if row.DeleteReason == DeleteReason.NotDeleted]
+    if len(live) > 1:
+        verdict.reverse_messages.append(f"Duplicate database entries for {video_path}")
+    match len(res):
+        case 0:
+            verdict.messages.append(f"Missing database entry for {video_path}")
+        case 1:
+            verdict.details.append(f"Exactly one entry for {video_path}")
+        case _:
+            verdict.details.append(f"Multiple entries for {video_path}")
+            verdict.details.append(
+                "    " + " => ".join(":".join(str(v) for v in r) for r in res)
+            )
+    return verdict
+
+
+def check_file(
+    video_path: str, entries: dict[tuple[str, str | None], list[Entry]]
+) -> Verdict:
+    path = Library.parse_path(video_path)
+    return check(video_path, path, lookup(path, entries))
+
+
+class DirectoryCache:
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self.conn = conn
+        with conn:
+            conn.execute("DROP TABLE IF EXISTS `ScrubDirectoryCache`")
+            conn.execute("DROP TABLE IF EXISTS `ScrubFileCache`")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS `ScrubVerdictCache` ("
+                "`Path` TEXT NOT NULL PRIMARY KEY, "
+                "`MtimeNs` INTEGER NOT NULL, "
+                "`Fingerprint` TEXT NOT NULL, "
+                "`Verdicts` TEXT NOT NULL"
+                ")"
+            )
+        self.directories: dict[str, tuple[int, str, str]] = {
+            path: (mtime_ns, fingerprint, verdicts)
+            for path, mtime_ns, fingerprint, verdicts in conn.execute(
+                "SELECT `Path`, `MtimeNs`, `Fingerprint`, `Verdicts`"
+                " FROM `ScrubVerdictCache`"
+            )
+        }
+        self.series: dict[str, tuple[typing.Any, ...]] = {
+            row[0]: tuple(row[1:])
+            for row in conn.execute(
+                "SELECT `Series`.`Metadata_SeriesId`, COUNT(*), MAX(`Episodes`.`Id`),"
+                " TOTAL(`Episodes`.`Id` * `Episodes`.`DeleteReason`),"
+                " TOTAL(`Episodes`.`Id` * LENGTH(`Episodes`.`Metadata_Filename`)),"
+                " TOTAL(`Episodes`.`Id` * LENGTH(`Episodes`.`Metadata_EpisodeNumber`)),"
+                " MIN(`Series`.`Metadata_Title`), MAX(`Series`.`Metadata_Title`)"
+                " FROM `Episodes`"
+                " INNER JOIN `Series` ON `Series`.`Id` = `Episodes`.`SeriesId`"
+                " GROUP BY `Series`.`Metadata_SeriesId`"
+            )
+        }
+        self.lock = threading.Lock()
+        self.seen: set[str] = set()
+        self.rows: list[tuple[str, int, str, str]] = []
+
+    def verdicts(
+        self,
+        directory: Library.Directory,
+        relpath: str,
+        paths: list[tuple[str, Library.LibraryPath | None]],
+        check_all: typing.Callable[[], list[Verdict]],
+    ) -> list[Verdict]:
+        with self.lock:
+            self.seen.add(relpath)
+        try:
+            mtime_ns = os.stat(directory.path).st_mtime_ns
+        except OSError:
+            return check_all()
+        fingerprint = json.dumps(
+            [
+                directory.path,
+                sorted(
+                    (series_id, self.series.get(series_id))
+                    for series_id in {
+                        path.series_id for _, path in paths if path is not None
+                    }
+                ),
+            ]
+        )
+        names = [entry.name for entry in directory.files]
+        cached = self.directories.get(relpath)
+        if cached is not None and cached[:2] == (mtime_ns, fingerprint):
+            verdicts = json.loads(cached[2])
+            if sorted(verdicts) == sorted(names):
+                Stats.count("cached directories")
+                return [Verdict(*verdicts[name]) for name in names]
+        result = check_all()
+        with self.lock:
+            self.rows.append(
+                (relpath, mtime_ns, fingerprint, json.dumps(dict(zip(names, result))))
+            )
+        return result
+
+    def save(self) -> None:
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM `ScrubVerdictCache` WHERE `Path` = ?",
+                [(path,) for path in self.directories.keys() - self.seen],
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO `ScrubVerdictCache`"
+                " (`Path`, `MtimeNs`, `Fingerprint`, `Verdicts`)"
+                " VALUES (?, ?, ?, ?)",
+                self.rows,
+            )
+
+
+def load_durations(conn: sqlite3.Connection) -> dict[int, float]:
+    durations: dict[int, float] = {}
+    for id, start, end in conn.execute(
+        "SELECT `Id`, `Metadata_RecordStartTime`, `Metadata_RecordEndTime`"
+        " FROM `Episodes`"
+    ):
+        if start is None or end is None:
+            continue
+        durations[id] = (
+            datetime.datetime.fromisoformat(end)
+            - datetime.datetime.fromisoformat(start)
+        ).total_seconds()
+    return durations
+
+
+def check_media(
+    video_path: str,
+    duration: float | None = None,
+    min_bitrate: float = 1.0,
+    samples: int = SAMPLES,
+) -> list[str]:
+    try:
+        with open(video_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < TS_PACKET_SIZE:
+                return [f"Empty media file {video_path}"]
+            messages: list[str] = []
+            if size % TS_PACKET_SIZE != 0:
+                messages.append(f"Partial MPEG-TS packet for {video_path}")
+            packets = size // TS_PACKET_SIZE
+            window = min(SAMPLE_PACKETS, packets)
+            starts = sorted(
+                {(packets - window) * i // max(1, samples - 1) for i in range(samples)}
+            )
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for start in starts:
+                    offset = start * TS_PACKET_SIZE
+                    sample = mm[
+                        offset : offset + window * TS_PACKET_SIZE : TS_PACKET_SIZE
+                    ]
+                    lost = len(sample) - len(sample.lstrip(TS_SYNC))
+                    if lost < len(sample):
+                        messages.append(
+                            f"Missing MPEG-TS sync at byte"
+                            f" {offset + lost * TS_PACKET_SIZE} for {video_path}"
                         )
-                    case _:
-                        pass
+                        break
+    except (OSError, ValueError) as e:
+        return [f"Unable to read {video_path}: {e}"]
+    if duration is not None and size * 8 < duration * min_bitrate * 1e6:
+        messages.append(f"File too small for recording duration for {video_path}")
+    return messages
+
+
+def check_integrity(
+    results: list[tuple[str, Verdict]],
+    durations: dict[int, float],
+    min_bitrate: float = 1.0,
+    jobs: int = 8,
+) -> None:
+    media = [
+        (video_path, verdict)
+        for video_path, verdict in results
+        if os.path.splitext(video_path)[1].lower() in MEDIA_EXTENSIONS
+    ]
+    Stats.expect("media files", len(media))
+    with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+        for (video_path, verdict), messages in zip(
+            media,
+            executor.map(
+                check_media,
+                [video_path for video_path, _ in media],
+                [
+                    next(
+                        (durations[id] for id in verdict.matches if id in durations),
+                        None,
+                    )
+                    for _, verdict in media
+                ],
+                itertools.repeat(min_bitrate),
+                chunksize=16,
+            ),
+        ):
+            verdict.messages.extend(messages)
+            if len(messages) > 0:
+                Stats.count("damaged media")
+            Stats.progress()
+
+
+def report(verdict: Verdict, verbose: bool, reverse: bool) -> None:
+    for message in verdict.messages:
+        print(message)
+    if reverse:
+        for message in verdict.reverse_messages:
+            print(message)
+    if verbose:
+        for message in verdict.details:
+            print(message)
+
+
+def shards(dir: str) -> list[str]:
+    with os.scandir(dir) as it:
+        return sorted(
+            entry.name
+            for entry in it
+            if entry.is_dir()
+            and not entry.is_symlink()
+            and not Library.pruned(entry.name)
+        )
+
+
+def scrub_shard(
+    dir: str,
+    shard: str,
+    conn: sqlite3.Connection,
+    cache: DirectoryCache | None = None,
+) -> list[tuple[str, Verdict]]:
+    directories: list[
+        tuple[Library.Directory, str, list[tuple[str, Library.LibraryPath | None]]]
+    ] = []
+    for directory in Library.walk(os.path.join(dir, shard)):
+        Stats.discover(len(directory.files))
+        relpath = os.path.normpath(os.path.join(shard, directory.relpath))
+        directories.append(
+            (
+                directory,
+                relpath,
+                [
+                    (
+                        os.path.join(directory.path, entry.name),
+                        Library.parse_relpath(os.path.join(relpath, entry.name)),
+                    )
+                    for entry in directory.files
+                ],
+            )
+        )
+    series_ids = {
+        path.series_id
+        for _, _, paths in directories
+        for _, path in paths
+        if path is not None
+    }
+    entries: dict[tuple[str, str | None], list[Entry]] | None = None
+    results: list[tuple[str, Verdict]] = []
+    for directory, relpath, paths in directories:
+
+        def check_all() -> list[Verdict]:
+            nonlocal entries
+            if entries is None:
+                with Stats.phase("load"):
+                    entries = load_entries(conn, series_ids)
+            verdicts: list[Verdict] = []
+            for video_path, path in paths:
+                with Stats.phase("check"):
+                    verdicts.append(check(video_path, path, lookup(path, entries)))
+            return verdicts
+
+        for (video_path, _), verdict in zip(
+            paths,
+            (
+                cache.verdicts(directory, relpath, paths, check_all)
+                if cache is not None
+                else check_all()
+            ),
+        ):
+            if len(verdict.messages) > 0:
+                Stats.count("mismatches")
+            Stats.progress()
+            results.append((video_path, verdict))
+    return results
+
+
+def scrub(
+    dir: str,
+    verbose: bool = False,
+    index: bool = False,
+    reverse: bool = False,
+    emit_updates: str | None = None,
+    incremental: bool = False,
+    jobs: int = 8,
+    integrity: bool = False,
+    min_bitrate: float = 1.0,
+) -> None:
+    with Library.connect(dir) as conn:
+        if index:
+            create_indexes(conn)
+        cache = DirectoryCache(conn) if incremental else None
+        Stats.expect("files")
+        local = threading.local()
+        lock = threading.Lock()
+        readers: list[sqlite3.Connection] = []
+
+        def open_reader() -> sqlite3.Connection:
+            reader = getattr(local, "reader", None)
+            if reader is None:
+                reader = Library.connect(dir, read_only=True)
+                local.reader = reader
+                with lock:
+                    readers.append(reader)
+            return reader
+
+        try:
+            with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+                results = sorted(
+                    itertools.chain.from_iterable(
+                        executor.map(
+                            lambda shard: scrub_shard(dir, shard, open_reader(), cache),
+                            shards(dir),
+                        )
+                    ),
+                    key=lambda result: result[0],
+                )
+        finally:
+            for reader in readers:
+                reader.close()
+        if integrity:
+            with Stats.phase("integrity"):
+                check_integrity(results, load_durations(conn), min_bitrate, jobs)
+        matches: dict[int, list[str]] = {}
+        for video_path, verdict in results:
+            report(verdict, verbose, reverse)
+            for id in verdict.matches:
+                matches.setdefault(id, []).append(video_path)
+        if reverse:
+            with Stats.phase("load"):
+                entries = load_entries(conn)
+            reconcile(entries, matches, emit_updates)
+        if cache is not None:
+            cache.save()
 
 
 if __name__ == "__main__":
@@ -109,5 +529,62 @@ if __name__ == "__main__":
         help="print information about valid entries",
         dest="verbose",
     )
+    parser.add_argument(
+        "--create-indexes",
+        action="store_true",
+        help="create the database indexes used to look up episodes",
+        dest="index",
+    )
+    parser.add_argument(
+        "--reverse",
+        action="store_true",
+        help="also report database entries whose files are missing",
+        dest="reverse",
+    )
+    parser.add_argument(
+        "--emit-updates",
+        help="write the SQL to mark entries with missing files as deleted to a file",
+        metavar="FILE",
+        dest="emit_updates",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only re-examine directories whose modification time or database rows"
+        " changed since the last scrub",
+        dest="incremental",
+    )
+    parser.add_argument(
+        "-j",
+        type=int,
+        default=8,
+        help="number of series folders to scrub concurrently",
+        dest="jobs",
+    )
+    parser.add_argument(
+        "--integrity",
+        action="store_true",
+        help="also sample each recording for truncation and MPEG-TS corruption",
+        dest="integrity",
+    )
+    parser.add_argument(
+        "--min-bitrate",
+        type=float,
+        default=1.0,
+        help="lowest plausible bitrate in Mbit/s when checking recording sizes",
+        dest="min_bitrate",
+    )
+    Stats.add_arguments(parser)
     parsed = parser.parse_args()
-    scrub(parsed.dir, parsed.verbose)
+    with Stats.collect(parsed.stats, parsed.profile):
+        scrub(
+            parsed.dir,
+            parsed.verbose,
+            parsed.index,
+            parsed.reverse or parsed.emit_updates is not None,
+            parsed.emit_updates,
+            parsed.incremental,
+            parsed.jobs,
+            parsed.integrity,
+            parsed.min_bitrate,
+        )
@@ -0,0 +1,216 @@
+import argparse
+import contextlib
+import cProfile
+import math
+import pstats
+import sys
+import threading
+import time
+import typing
+
+BUCKETS = 32
+PROGRESS_INTERVAL = 0.5
+
+
+class Histogram:
+    def __init__(self) -> None:
+        self.buckets = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        micros = int(seconds * 1e6)
+        self.buckets[min(BUCKETS - 1, micros.bit_length())] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction: float) -> float:
+        rank = math.ceil(self.count * fraction)
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(self.max, (1 << bucket) / 1e6)
+        return self.max
+
+
+class Phase:
+    def __init__(self, stats: "Stats", name: str) -> None:
+        self.stats = stats
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *_) -> None:
+        self.stats.record(self.name, time.perf_counter() - self.start)
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.phases: dict[str, Histogram] = {}
+        self.counters: dict[str, int] = {}
+        self.created = time.monotonic()
+        self.started = self.created
+        self.unit = ""
+        self.done = 0
+        self.total: int | None = None
+        self.shown = 0.0
+        self.line = 0
+
+    def phase(self, name: str) -> typing.ContextManager[None]:
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return Phase(self, name)
+
+    def record(self, name: str, seconds: float) -> None:
+        with self.lock:
+            histogram = self.phases.get(name)
+            if histogram is None:
+                histogram = Histogram()
+                self.phases[name] = histogram
+            histogram.add(seconds)
+
+    def count(self, name: str, n: int = 1) -> None:
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def expect(self, unit: str, total: int | None = None) -> None:
+        if not self.enabled:
+            return
+        with self.lock:
+            if unit == self.unit:
+                if total is not None:
+                    self.total = (self.total or 0) + total
+                return
+            self.clear()
+            self.unit = unit
+            self.done = 0
+            self.total = total
+            self.started = time.monotonic()
+            self.shown = 0.0
+
+    def discover(self, n: int = 1) -> None:
+        if not self.enabled:
+            return
+        with self.lock:
+            self.total = (self.total or 0) + n
+
+    def progress(self, n: int = 1) -> None:
+        if not self.enabled:
+            return
+        with self.lock:
+            self.done += n
+            now = time.monotonic()
+            if now - self.shown < PROGRESS_INTERVAL or not sys.stderr.isatty():
+                return
+            self.shown = now
+            elapsed = now - self.started
+            rate = self.done / elapsed if elapsed > 0 else 0.0
+            line = f"{self.done}"
+            if self.total is not None:
+                line += f"/{self.total}"
+            line += f" {self.unit}, {rate:.1f}/s"
+            if self.total is not None and rate > 0:
+                line += f", ETA {duration(max(0, self.total - self.done) / rate)}"
+            sys.stderr.write("\r" + line.ljust(self.line))
+            sys.stderr.flush()
+            self.line = len(line)
+
+    def clear(self) -> None:
+        if self.line > 0:
+            sys.stderr.write("\r" + " " * self.line + "\r")
+            self.line = 0
+
+    def summary(self, file: typing.TextIO = sys.stderr) -> None:
+        with self.lock:
+            self.clear()
+            print(
+                f"{'phase':<16} {'calls':>8} {'total':>10} {'mean':>10}"
+                f" {'p50':>10} {'p90':>10} {'p99':>10} {'max':>10}",
+                file=file,
+            )
+            for name, h in self.phases.items():
+                print(
+                    f"{name:<16} {h.count:>8} {h.total:>10.3f}"
+                    f" {h.total / h.count:>10.6f} {h.percentile(0.5):>10.6f}"
+                    f" {h.percentile(0.9):>10.6f} {h.percentile(0.99):>10.6f}"
+                    f" {h.max:>10.6f}",
+                    file=file,
+                )
+            for name, value in self.counters.items():
+                print(f"{name:<16} {value:>8}", file=file)
+            print(
+                f"{'wall time':<16} {duration(time.monotonic() - self.created):>8}",
+                file=file,
+            )
+
+
+def duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+stats = Stats()
+phase = stats.phase
+count = stats.count
+expect = stats.expect
+discover = stats.discover
+progress = stats.progress
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="show progress and print timings and counters at exit",
+        dest="stats",
+    )
+    parser.add_argument(
+        "--profile",
+        help="write a cProfile dump to a file",
+        dest="profile",
+    )
+
+
+@contextlib.contextmanager
+def collect(enabled: bool, profile: str | None = None) -> typing.Iterator[Stats]:
+    stats.enabled = enabled
+    stats.created = time.monotonic()
+    profilers: list[cProfile.Profile] = []
+    lock = threading.Lock()
+
+    def profile_thread(*_) -> None:
+        profiler = cProfile.Profile()
+        with lock:
+            profilers.append(profiler)
+        profiler.enable()
+
+    # Before 3.12 each thread needs its own profiler; from 3.12 one profiler
+    # sees every thread and a second one cannot be enabled.
+    per_thread = sys.version_info < (3, 12)
+    if profile is not None:
+        profilers.append(cProfile.Profile())
+        if per_thread:
+            threading.setprofile(profile_thread)
+        profilers[0].enable()
+    try:
+        yield stats
+    finally:
+        if profile is not None:
+            if per_thread:
+                threading.setprofile(None)
+            with lock:
+                for profiler in profilers:
+                    profiler.disable()
+                pstats.Stats(*profilers).dump_stats(profile)
+        if enabled:
+            stats.summary()